@@ -1,24 +1,30 @@
 #!/usr/bin/python3
 import os
 import psycopg2
+from psycopg2.extras import execute_values
 import time
 import json
 import csv
+import io
+import re
 from datetime import datetime
 
-# PostgreSQL connection
-conn = psycopg2.connect(
-    dbname="robot_db",
-    user="db_admin",
-    password="iku1234",
-    host="localhost",
-    port="5432"
-)
-cur = conn.cursor()
+import config
+import db
+import metrics
+import rollups
+from events import EVENT_CHANNEL, event_payload
+from fswatch import DirWatcher
+from segments import read_segment
+
+# PostgreSQL connection, checked out of the shared pool (db.py).
+# A lost connection is dropped by reset_connection() and replaced on the next loop pass.
+conn = None
+cur = None
 
 # Directories
-frames_dir = "/home/mergen/Desktop/db/Images"
-logs_dir = "/home/mergen/Desktop/db/Logs"
+frames_dir = os.path.join(config.DATA_DIR, "Images")
+logs_dir = os.path.join(config.DATA_DIR, "Logs")
 ai_log_path = os.path.join(logs_dir, "ai_log.txt")
 log_file = os.path.join(logs_dir, "log.txt")
 image_info_file = os.path.join(logs_dir, "image_info.json")
@@ -27,178 +33,651 @@ image_info_file = os.path.join(logs_dir, "image_info.json")
 os.makedirs(frames_dir, exist_ok=True)
 os.makedirs(logs_dir, exist_ok=True)
 
-processed_files = set()
+# Durable ingest checkpoint: path -> (size, mtime_ns) of the version already in the DB.
+# Backed by the ingest_files table and written in the same transaction as the data rows,
+# so a restart only has to look at files that are new or have changed since.
+checkpoint = {}
+
+# Seconds to wait for filesystem events before the AI log is checked again
+POLL_INTERVAL = 1
+
+# Batching: files are written in one transaction per batch.
+# A batch is flushed when it is full or when its oldest file has waited BATCH_MAX_LATENCY seconds.
+BATCH_MAX_SIZE = 500
+BATCH_MAX_LATENCY = 0.5
+# A file that keeps failing on its own is recorded as an error after this many attempts
+MAX_FILE_ATTEMPTS = 3
+failed_attempts = {}
+
+STAT_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+# Prometheus exporter (UL.py has no web server of its own)
+METRICS_PORT = config.UL_METRICS_PORT
+batch_seconds = metrics.Histogram("ul_batch_seconds", "DB time to write one ingest batch (one transaction)",
+                                  buckets=metrics.LATENCY_BUCKETS)
+pickup_seconds = metrics.Histogram("ul_pickup_seconds", "Seconds from a file landing on the Pi4 to its commit",
+                                   buckets=metrics.LATENCY_BUCKETS)
+files_ingested = metrics.Counter("ul_files_ingested_total", "Files written to the DB", ("kind",))
+queue_depth = metrics.Gauge("ul_queue_depth", "Files waiting for the next batch flush")
+ai_rows_inserted = metrics.Counter("ul_ai_results_total", "ai_results rows inserted from ai_log.txt")
+
 
-print("📱 Listening for incoming files...")
+# === CONNECTION ===
+def connect():
+    global conn, cur
+    conn = db.raw_connection()
+    cur = conn.cursor()
 
-while True:
+
+# Rolls back the current transaction. Returns False when the connection itself is gone;
+# it is then invalidated so the pool opens a fresh one on the next connect().
+def reset_connection():
+    global conn, cur
+    if conn is None:
+        return False
     try:
-        timestamp = datetime.now()
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        print(f"[DB] Connection lost ({e}) → reconnecting")
+        conn.invalidate()
+        conn = cur = None
+        return False
 
-        # === 1. IMAGES ===
-        images = sorted([f for f in os.listdir(frames_dir) if f.endswith(".jpg")])
-        for image_file in images:
-            if image_file in processed_files:
-                continue
-
-            image_path = os.path.join(frames_dir, image_file)
-            cur.execute("""
-                INSERT INTO Image_Data (ImageTime, ImagePath, Robot_LocationID, RobotID, ObjectID)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING imageid
-            """, (timestamp, image_path, 2, 2, 2))
-            imageid = cur.fetchone()[0]
-            conn.commit()
 
-            info = {"imageid": imageid, "filename": image_file}
-            with open(image_info_file, "w") as jf:
-                json.dump(info, jf)
-            print(f"[INFO] image_info.json created for {image_file} (ID={imageid})")
-
-            log_entry = f"[{timestamp}] Image saved: {image_file} (ID={imageid})\n"
-            with open(log_file, "a") as logf:
-                logf.write(log_entry)
-            cur.execute("""
-                INSERT INTO Logs (LogTime, Action, UserID, LogFilePath)
-                VALUES (%s, %s, %s, %s)
-            """, (timestamp, f"Image {image_file} inserted with ID={imageid}", 2, log_file))
-            conn.commit()
+# === CHECKPOINT ===
+def load_checkpoint():
+    cur.execute("SELECT to_regclass('ingest_files') IS NULL")
+    first_run = cur.fetchone()[0]
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_files (
+            path TEXT PRIMARY KEY,
+            size BIGINT NOT NULL,
+            mtime_ns BIGINT NOT NULL,
+            processed_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+    if first_run:
+        seed_checkpoint()
+    cur.execute("SELECT path, size, mtime_ns FROM ingest_files")
+    for path, size, mtime_ns in cur.fetchall():
+        checkpoint[path] = (size, mtime_ns)
+    conn.commit()
+    print(f"[INFO] Checkpoint loaded: {len(checkpoint)} files already ingested")
 
-            print(f"[IMG ✓] {image_file} processed with ID={imageid}")
-            processed_files.add(image_file)
-
-        # === 2. JSON LOGS ===
-        json_logs = sorted([f for f in os.listdir(logs_dir) if f.endswith(".json") and f.lower() != "image_info.json"])
-        for json_file in json_logs:
-            if json_file in processed_files:
-                continue
-
-            json_path = os.path.join(logs_dir, json_file)
-            json_file_lower = json_file.lower()
-            with open(json_path, "r") as jf:
-                if json_file_lower.startswith("arduino_"):
-                    try:
-                        data_raw = json.load(jf)
-                        data_list = [data_raw] if isinstance(data_raw, dict) else data_raw
-                        for data in data_list:
-                            cur.execute("""
-                                INSERT INTO arduino_logs (timestamp, gyrox, gyroy, gyroz, neckservo, headservo,
-                                                           frontdistance, leftdistance, rightdistance, motorstate)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            """, (
-                                data.get("Timestamp"),
-                                data.get("Gyro", {}).get("X"),
-                                data.get("Gyro", {}).get("Y"),
-                                data.get("Gyro", {}).get("Z"),
-                                data.get("ServoAngles", {}).get("Neck"),
-                                data.get("ServoAngles", {}).get("Head"),
-                                data.get("Distances", {}).get("Front"),
-                                data.get("Distances", {}).get("Left"),
-                                data.get("Distances", {}).get("Right"),
-                                data.get("MotorState")
-                            ))
-                        conn.commit()
-                        action = f"Arduino data parsed and inserted: {json_file}"
-                    except Exception as e:
-                        action = f"[ERROR] Failed to parse Arduino JSON ({json_file}): {e}"
-                        print(action)
-                elif json_file_lower in ("pi5_latest.json", "pi5_status.json"):
-                    try:
-                        data = json.load(jf)
-                        cur.execute("""
-                            INSERT INTO pi5_stats (timestamp, cpu, ram, cpu_temp, gpu_temp, upload_speed, download_speed)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            data.get("Timestamp"),
-                            data.get("CPU"),
-                            data.get("RAM"),
-                            data.get("CPU Temp"),
-                            data.get("GPU Temp"),
-                            data.get("Upload (KB/s)"),
-                            data.get("Download (KB/s)")
-                        ))
-                        conn.commit()
-                        action = "Pi5 system stats parsed and inserted"
-                    except Exception as e:
-                        action = f"[ERROR] Failed to parse Pi5 stats ({json_file}): {e}"
-                        print(action)
-                else:
-                    action = f"Unknown JSON file ignored: {json_file}"
-
-            log_entry = f"[{timestamp}] {action}\n"
-            with open(log_file, "a") as logf:
-                logf.write(log_entry)
-            cur.execute("""
-                INSERT INTO Logs (LogTime, Action, UserID, LogFilePath)
-                VALUES (%s, %s, %s, %s)
-            """, (timestamp, action, 2, log_file))
-            conn.commit()
 
-            print(f"[JSON ✓] {json_file} processed")
-            processed_files.add(json_file)
-
-        # === 3. AI LOG (ONLY LAST LINE) ===
-        if os.path.exists(ai_log_path):
-            with open(ai_log_path, "r") as f:
-                lines = [line.strip() for line in f if line.strip()]
-            
-            if len(lines) > 1:
-                header = lines[0]
-                last_row = lines[-1]
-                reader = csv.reader([last_row])
-                for row in reader:
-                    if len(row) < 5:
-                        continue
-                    try:
-                        imageid_str, timestamp_str, mse, anomaly_str, detected_objects_str = row
-                        imageid = int(imageid_str)
-                        anomaly = anomaly_str.strip().lower() == "true"
-                        timestamp_log = datetime.fromisoformat(timestamp_str)
-                        detected_objects = [obj.strip() for obj in detected_objects_str.split(",") if obj.strip()]
-
-                        cur.execute("SELECT 1 FROM Image_Data WHERE imageid = %s", (imageid,))
-                        if cur.fetchone() is None:
-                            print(f"[AI LOG SKIP] imageid {imageid} not found in Image_Data → skipped.")
-                            continue
-                        cur.execute("SELECT 1 FROM ai_results WHERE imageid = %s", (imageid,))
-                        if cur.fetchone():
-                            print(f"[AI LOG SKIP] imageid {imageid} already in ai_results → skipped.")
-                            continue
-
-                        gps_id = None
-                        cur.execute("""
-                            INSERT INTO ai_results (date, anomalystatus, robot_locationid, imageid, robotid, gps_id, objectid, description)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (timestamp_log, anomaly, 1, imageid, 1, gps_id, None, "Inserted from ai_log.txt"))
-
-                        for obj in detected_objects:
-                            cur.execute("""
-                                INSERT INTO object (objectname, initial_latitude, initial_longitude, new_latitude, new_longitude, time)
-                                VALUES (%s, %s, %s, %s, %s, %s)
-                            """, (obj, 0.0, 0.0, 0.0, 0.0, timestamp_log))
-
-                        action = f"AI_RESULT inserted - ID={imageid} - MSE={mse} - Anomaly={anomaly} - Objects={detected_objects_str}"
-                        cur.execute("""
-                            INSERT INTO Logs (LogTime, Action, UserID, LogFilePath)
-                            VALUES (%s, %s, %s, %s)
-                        """, (timestamp_log, action, 2, log_file))
-                        conn.commit()
-                        print(f"[AI ✓] imageid {imageid} inserted into ai_results.")
-                    except Exception as e:
-                        conn.rollback()
-                        print(f"[HATA] AI_LOG satırı işlenemedi: {e}")
-
-            with open(log_file, "a") as logf:
-                logf.write(f"[{timestamp}] AI_LOG processed.\n")
-            print("📄 ai_log.txt has been processed into the database.")
-
-    except KeyboardInterrupt:
-        print("🚫 Program terminated.")
-        break
+# First start on a robot that already has data: files ingested by the old UL.py are only
+# known from Image_Data and the Logs actions. They are claimed at their current size/mtime
+# so the catch-up scan does not insert them a second time.
+def seed_checkpoint():
+    cur.execute("SELECT ImagePath FROM Image_Data WHERE ImagePath IS NOT NULL")
+    paths = {row[0] for row in cur.fetchall()}
+    cur.execute("""
+        SELECT substring(Action FROM 'Arduino data parsed and inserted: (.*)$') FROM Logs
+        WHERE Action LIKE 'Arduino data parsed and inserted: %'
+    """)
+    paths.update(os.path.join(logs_dir, row[0]) for row in cur.fetchall())
+    cur.execute("SELECT EXISTS (SELECT 1 FROM Logs WHERE Action = 'Pi5 system stats parsed and inserted')")
+    if cur.fetchone()[0]:
+        paths.update(os.path.join(logs_dir, name) for name in ("Pi5_Latest.json", "Pi5_Status.json"))
+
+    rows = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        rows.append((path, st.st_size, st.st_mtime_ns))
+    if rows:
+        execute_values(cur, "INSERT INTO ingest_files (path, size, mtime_ns) VALUES %s ON CONFLICT DO NOTHING", rows)
+    print(f"[INFO] Checkpoint seeded with {len(rows)} files already in the database")
+
+
+# Claims file versions inside the current transaction.
+# Returns the set of paths that were not ingested yet (idempotent re-insert).
+def claim_files(items):
+    claimed = execute_values(cur, """
+        INSERT INTO ingest_files (path, size, mtime_ns)
+        VALUES %s
+        ON CONFLICT (path) DO UPDATE
+            SET size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns, processed_at = now()
+            WHERE (ingest_files.size, ingest_files.mtime_ns) IS DISTINCT FROM (EXCLUDED.size, EXCLUDED.mtime_ns)
+        RETURNING path
+    """, [(item["path"], *item["stamp"]) for item in items], fetch=True)
+    return {row[0] for row in claimed}
+
+
+# === LIVE EVENTS ===
+# NOTIFYs sent inside the ingest transaction; webapi.py fans them out on /events after commit.
+def notify_events(payloads):
+    if payloads:
+        execute_values(cur, f"SELECT pg_notify('{EVENT_CHANNEL}', v.payload) FROM (VALUES %s) AS v(payload)",
+                       [(p,) for p in payloads])
+
+
+# === 1. IMAGES ===
+def insert_images(items, timestamp):
+    if not items:
+        return []
+    rows = db.run_prepared(conn, "insert_images", timestamp, [item["path"] for item in items], 2, 2, 2)
+    ids = {path: imageid for imageid, path in rows}
+
+    results = []
+    for item in items:
+        imageid = ids[item["path"]]
+        results.append((item["filename"], imageid, f"Image {item['filename']} inserted with ID={imageid}"))
+    return results
+
+
+# === 2. JSON LOGS ===
+def arduino_row(data):
+    return (
+        data.get("Timestamp"),
+        data.get("Gyro", {}).get("X"),
+        data.get("Gyro", {}).get("Y"),
+        data.get("Gyro", {}).get("Z"),
+        data.get("ServoAngles", {}).get("Neck"),
+        data.get("ServoAngles", {}).get("Head"),
+        data.get("Distances", {}).get("Front"),
+        data.get("Distances", {}).get("Left"),
+        data.get("Distances", {}).get("Right"),
+        data.get("MotorState")
+    )
+
+
+# Pi5 stats arrive as numbers (send_database.py StatsSampler); files from older
+# Pi5 builds still carry strings like "12.3%" / "512.0 MB" / "N/A".
+def stat_number(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = STAT_NUMBER_RE.search(str(value))
+    return float(match.group()) if match else None
+
+
+def pi5_row(data):
+    return (
+        data.get("Timestamp"),
+        stat_number(data.get("CPU")),
+        stat_number(data.get("RAM")),
+        stat_number(data.get("CPU Temp")),
+        stat_number(data.get("GPU Temp")),
+        stat_number(data.get("Upload (KB/s)")),
+        stat_number(data.get("Download (KB/s)"))
+    )
+
+
+# Parses every JSON file of the batch in Python and inserts the rows with one statement per table.
+# Returns (filename, action) pairs for the Logs table and the live-feed events.
+def insert_json_logs(items):
+    arduino_rows = []
+    pi5_rows = []
+    results = []
+    events = []
+    for item in items:
+        json_file = item["filename"]
+        json_file_lower = json_file.lower()
+        if json_file_lower.startswith("arduino_"):
+            try:
+                with open(item["path"], "r") as jf:
+                    data_raw = json.load(jf)
+                data_list = [data_raw] if isinstance(data_raw, dict) else data_raw
+                arduino_rows.extend(arduino_row(data) for data in data_list)
+                if data_list:
+                    events.append(event_payload("arduino", file=json_file, samples=len(data_list),
+                                                latest=data_list[-1]))
+                action = f"Arduino data parsed and inserted: {json_file}"
+            except Exception as e:
+                action = f"[ERROR] Failed to parse Arduino JSON ({json_file}): {e}"
+                print(action)
+        elif json_file_lower in ("pi5_latest.json", "pi5_status.json"):
+            try:
+                with open(item["path"], "r") as jf:
+                    data = json.load(jf)
+                pi5_rows.append(pi5_row(data))
+                events.append(event_payload("pi5_stats", stats=data))
+                action = "Pi5 system stats parsed and inserted"
+            except Exception as e:
+                action = f"[ERROR] Failed to parse Pi5 stats ({json_file}): {e}"
+                print(action)
+        else:
+            action = f"Unknown JSON file ignored: {json_file}"
+        results.append((json_file, action))
+
+    if arduino_rows:
+        execute_values(cur, """
+            INSERT INTO arduino_logs (timestamp, gyrox, gyroy, gyroz, neckservo, headservo,
+                                      frontdistance, leftdistance, rightdistance, motorstate)
+            VALUES %s
+        """, arduino_rows)
+    if pi5_rows:
+        execute_values(cur, """
+            INSERT INTO pi5_stats (timestamp, cpu, ram, cpu_temp, gpu_temp, upload_speed, download_speed)
+            VALUES %s
+        """, pi5_rows)
+    return results, events
+
+
+# Arduino NDJSON segments (send_database.py SegmentWriter): every sample of every segment
+# in the batch is streamed into arduino_logs with a single COPY.
+def load_arduino_segments(items):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    results = []
+    events = []
+    for item in items:
+        count = 0
+        latest = None
+        for data in read_segment(item["path"]):
+            writer.writerow(arduino_row(data))
+            count += 1
+            latest = data
+        results.append((item["filename"], f"Arduino segment loaded: {item['filename']} ({count} samples)"))
+        if latest is not None:
+            events.append(event_payload("arduino", file=item["filename"], samples=count, latest=latest))
+
+    if buf.tell():
+        buf.seek(0)
+        cur.copy_expert("""
+            COPY arduino_logs (timestamp, gyrox, gyroy, gyroz, neckservo, headservo,
+                               frontdistance, leftdistance, rightdistance, motorstate)
+            FROM STDIN WITH (FORMAT csv)
+        """, buf)
+    return results, events
+
+
+# === BATCH WRITER ===
+# Writes one batch of files in a single transaction with a single commit.
+def ingest_batch(items):
+    timestamp = datetime.now()
+    started = time.perf_counter()
+    claimed = claim_files(items)
+    new_items = [item for item in items if item["path"] in claimed]
+
+    images = insert_images([i for i in new_items if i["kind"] == "image"], timestamp)
+    json_logs, events = insert_json_logs([i for i in new_items if i["kind"] == "json"])
+    segments, segment_events = load_arduino_segments([i for i in new_items if i["kind"] == "segment"])
+    json_logs += segments
+    events += segment_events
+    if json_logs:
+        # Minute/hour rollups move forward in the same transaction as the raw rows
+        rollups.update_rollups(cur)
+
+    actions = [action for _, _, action in images] + [action for _, action in json_logs]
+    if actions:
+        db.run_prepared(conn, "insert_logs", [timestamp] * len(actions), actions, 2, log_file)
+    notify_events([event_payload("frame", filename=filename, imageid=imageid, url=f"/image/{filename}")
+                   for filename, imageid, _ in images] + events)
+    conn.commit()
+    batch_seconds.observe(time.perf_counter() - started)
+
+    committed = time.time()
+    for item in items:
+        checkpoint[item["path"]] = item["stamp"]
+        failed_attempts.pop(item["path"], None)
+    for item in new_items:
+        files_ingested.labels(kind=item["kind"]).inc()
+        pickup_seconds.observe(max(0.0, committed - item["stamp"][1] / 1e9))
+    for filename, _, _ in images:
+        metrics.observe_stage("ingested", filename)
+
+    # File side effects once per batch instead of once per row
+    if images:
+        filename, imageid, _ = images[-1]
+        with open(image_info_file, "w") as jf:
+            json.dump({"imageid": imageid, "filename": filename}, jf)
+        print(f"[INFO] image_info.json created for {filename} (ID={imageid})")
+    with open(log_file, "a") as logf:
+        for filename, imageid, _ in images:
+            logf.write(f"[{timestamp}] Image saved: {filename} (ID={imageid})\n")
+        for _, action in json_logs:
+            logf.write(f"[{timestamp}] {action}\n")
+
+    for filename, imageid, _ in images:
+        print(f"[IMG ✓] {filename} processed with ID={imageid}")
+    for filename, _ in json_logs:
+        print(f"[JSON ✓] {filename} processed")
+    if len(items) > 1:
+        print(f"[BATCH ✓] {len(new_items)}/{len(items)} files written in one transaction")
+
+
+# Records a file that failed on its own so it is not retried forever.
+def record_failed_file(item, error):
+    timestamp = datetime.now()
+    action = f"[ERROR] Failed to ingest {item['filename']}: {error}"
+    claim_files([item])
+    cur.execute("""
+        INSERT INTO Logs (LogTime, Action, UserID, LogFilePath)
+        VALUES (%s, %s, %s, %s)
+    """, (timestamp, action, 2, log_file))
+    conn.commit()
+    checkpoint[item["path"]] = item["stamp"]
+    failed_attempts.pop(item["path"], None)
+    with open(log_file, "a") as logf:
+        logf.write(f"[{timestamp}] {action}\n")
+    print(action)
+
+
+# Flushes a batch; if it fails, the batch is rolled back and split in halves
+# until the bad files are isolated. Returns the items to retry on the next flush.
+def flush_batch(items):
+    try:
+        ingest_batch(items)
+        return []
     except Exception as e:
-        print(f"[HATA] General loop error: {e}")
+        if not reset_connection():
+            # Connection lost, not a bad file: retry the whole batch once reconnected
+            print(f"[HATA] Batch of {len(items)} files not written: {e}")
+            return items
+        if len(items) > 1:
+            mid = len(items) // 2
+            return flush_batch(items[:mid]) + flush_batch(items[mid:])
+
+        item = items[0]
+        attempts = failed_attempts.get(item["path"], 0) + 1
+        failed_attempts[item["path"]] = attempts
+        print(f"[HATA] {item['filename']} could not be processed (attempt {attempts}): {e}")
+        if attempts >= MAX_FILE_ATTEMPTS:
+            try:
+                record_failed_file(item, e)
+                return []
+            except Exception as e2:
+                reset_connection()
+                print(f"[HATA] Could not record failure for {item['filename']}: {e2}")
+        return [item]
+
+
+# === 3. AI LOG (TAIL) ===
+# ai_log.txt is followed like `tail -F`: we remember the inode and byte offset of the last
+# complete line, so every row appended since the last pass is read exactly once.
+# The offset lives in ingest_offsets and is committed together with the inserted rows.
+ai_log_state = {"inode": None, "offset": 0}
+
+# Upper bound for one read so a huge backlog is worked off in several transactions
+AI_LOG_MAX_READ = 1024 * 1024
+# ai_results.imageid / Image_Data.imageid are INTEGER columns
+PG_INTEGER_MAX = 2 ** 31 - 1
+
+
+def load_ai_log_offset():
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_offsets (
+            path TEXT PRIMARY KEY,
+            inode BIGINT NOT NULL,
+            byte_offset BIGINT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("SELECT inode, byte_offset FROM ingest_offsets WHERE path = %s", (ai_log_path,))
+    row = cur.fetchone()
+    conn.commit()
+    if row:
+        ai_log_state["inode"], ai_log_state["offset"] = row
+        print(f"[INFO] ai_log.txt resumes at byte {ai_log_state['offset']}")
+
+
+# Returns (rows, new_inode, new_offset) for the complete CSV lines appended since the last pass.
+def read_new_ai_rows():
+    try:
+        st = os.stat(ai_log_path)
+    except FileNotFoundError:
+        return [], None, 0
+
+    inode, offset = ai_log_state["inode"], ai_log_state["offset"]
+    if st.st_ino != inode or st.st_size < offset:
+        # Rotated (new inode) or truncated: start again from the top
+        if inode is not None:
+            print("[AI LOG] ai_log.txt rotated/truncated → reading from the beginning")
+        inode, offset = st.st_ino, 0
+    if st.st_size == offset:
+        return [], inode, offset
+
+    with open(ai_log_path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(min(st.st_size - offset, AI_LOG_MAX_READ))
+
+    # Only consume complete lines; a half-written last line is picked up next pass
+    end = chunk.rfind(b"\n")
+    if end < 0:
+        return [], inode, offset
+    lines = chunk[:end + 1].decode("utf-8", errors="replace").splitlines()
+    if offset == 0 and lines:
+        lines = lines[1:]  # header
+    rows = list(csv.reader(line for line in lines if line.strip()))
+    return rows, inode, offset + end + 1
+
+
+# Validates all rows of a pass at once; invalid rows are reported and dropped.
+def parse_ai_rows(rows):
+    parsed = []
+    for row in rows:
+        if len(row) < 5:
+            continue
+        try:
+            imageid_str, timestamp_str, mse, anomaly_str, detected_objects_str = row
+            imageid = int(imageid_str)
+            if not 0 < imageid <= PG_INTEGER_MAX:
+                raise ValueError(f"imageid {imageid} out of range")
+            parsed.append({
+                "imageid": imageid,
+                "timestamp": datetime.fromisoformat(timestamp_str),
+                "mse": mse,
+                "anomaly": anomaly_str.strip().lower() == "true",
+                "objects_str": detected_objects_str,
+                "objects": [obj.strip() for obj in detected_objects_str.split(",") if obj.strip()],
+            })
+        except ValueError as e:
+            print(f"[AI LOG SKIP] Invalid row {row}: {e}")
+    return parsed
+
+
+# Writes parsed AI rows inside the current transaction (no commit).
+# Returns (imageid, ImagePath) of every row inserted into ai_results.
+def insert_ai_rows(results):
+    # One set-based lookup instead of two SELECTs per row
+    ids = list({r["imageid"] for r in results})
+    known, paths = {}, {}
+    if ids:
+        for imageid, path, has_result in db.run_prepared(conn, "images_with_ai_state", ids):
+            known[imageid] = has_result
+            paths[imageid] = path
+
+    ai_rows, object_rows, log_rows, events, inserted = [], [], [], [], []
+    for r in results:
+        imageid = r["imageid"]
+        if imageid not in known:
+            print(f"[AI LOG SKIP] imageid {imageid} not found in Image_Data → skipped.")
+            continue
+        if known[imageid]:
+            print(f"[AI LOG SKIP] imageid {imageid} already in ai_results → skipped.")
+            continue
+        known[imageid] = True  # duplicates inside the same pass
+
+        ai_rows.append((r["timestamp"], r["anomaly"], imageid))
+        object_rows.extend((obj, 0.0, 0.0, 0.0, 0.0, r["timestamp"]) for obj in r["objects"])
+        action = (f"AI_RESULT inserted - ID={imageid} - MSE={r['mse']} - "
+                  f"Anomaly={r['anomaly']} - Objects={r['objects_str']}")
+        log_rows.append((r["timestamp"], action))
+        events.append(event_payload("ai_result", imageid=imageid, date=r["timestamp"],
+                                    anomaly=r["anomaly"], objects=r["objects"]))
+        inserted.append((imageid, paths[imageid]))
+
+    if ai_rows:
+        dates, anomalies, imageids = map(list, zip(*ai_rows))
+        db.run_prepared(conn, "insert_ai_results", dates, anomalies, imageids, "Inserted from ai_log.txt")
+    if object_rows:
+        execute_values(cur, """
+            INSERT INTO object (objectname, initial_latitude, initial_longitude, new_latitude, new_longitude, time)
+            VALUES %s
+        """, object_rows)
+    if log_rows:
+        times, actions = map(list, zip(*log_rows))
+        db.run_prepared(conn, "insert_logs", times, actions, 2, log_file)
+    notify_events(events)
+    return inserted
+
+
+def save_ai_log_offset(inode, offset):
+    cur.execute("""
+        INSERT INTO ingest_offsets (path, inode, byte_offset)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (path) DO UPDATE
+            SET inode = EXCLUDED.inode, byte_offset = EXCLUDED.byte_offset, updated_at = now()
+    """, (ai_log_path, inode, offset))
+
+
+# Commits a pass together with its new offset. If the DB rejects a row, the pass is
+# rolled back and split in halves (like flush_batch) until the bad rows are isolated
+# and skipped; the offset is then committed on its own after the good halves.
+# A replayed pass is harmless: rows already in ai_results are skipped.
+# Raises when the connection itself is lost, so nothing is skipped and the offset stays.
+def flush_ai_rows(results, inode=None, offset=None):
+    try:
+        inserted = insert_ai_rows(results)
+        if offset is not None:
+            save_ai_log_offset(inode, offset)
+        conn.commit()
+        return inserted
+    except Exception as e:
+        if not reset_connection():
+            raise
+        if len(results) > 1:
+            mid = len(results) // 2
+            inserted = flush_ai_rows(results[:mid]) + flush_ai_rows(results[mid:])
+        else:
+            if results:
+                print(f"[AI LOG SKIP] imageid {results[0]['imageid']} rejected by the database: {e}")
+            inserted = []
+        if offset is not None:
+            save_ai_log_offset(inode, offset)
+            conn.commit()
+        return inserted
+
+
+def process_ai_log():
+    while True:
+        rows, inode, new_offset = read_new_ai_rows()
+        if inode is None or (new_offset == ai_log_state["offset"] and inode == ai_log_state["inode"]):
+            return
+
+        timestamp = datetime.now()
+        results = parse_ai_rows(rows)
+        try:
+            inserted = flush_ai_rows(results, inode, new_offset)
+        except Exception as e:
+            reset_connection()
+            print(f"[HATA] AI_LOG satırları işlenemedi: {e}")
+            return
+
+        ai_log_state["inode"], ai_log_state["offset"] = inode, new_offset
+        ai_rows_inserted.inc(len(inserted))
+        for imageid, path in inserted:
+            metrics.observe_stage("ai_result", os.path.basename(path))
+            print(f"[AI ✓] imageid {imageid} inserted into ai_results.")
+        with open(log_file, "a") as logf:
+            logf.write(f"[{timestamp}] AI_LOG processed: {len(rows)} new rows, {len(inserted)} inserted.\n")
+        print(f"📄 ai_log.txt: {len(rows)} new rows processed into the database.")
+
+
+# === DISPATCH ===
+def classify(directory, filename):
+    if directory == frames_dir and filename.endswith(".jpg"):
+        return "image"
+    if (directory == logs_dir and filename.endswith(".json")
+            and filename.lower() != "image_info.json"):
+        return "json"
+    if (directory == logs_dir and filename.lower().startswith("arduino_")
+            and filename.endswith((".ndjson", ".ndjson.gz", ".ndjson.zst"))):
+        return "segment"
+    return None
+
+
+# Stats the queued files right before the flush so overwritten files are read at their latest version.
+def collect_items(queued):
+    items = []
+    for path, (directory, filename, kind) in queued.items():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Same name but new size/mtime (e.g. Pi5_Latest.json being overwritten) is a new version
+        stamp = (st.st_size, st.st_mtime_ns)
+        if checkpoint.get(path) == stamp:
+            continue
+        items.append({"path": path, "directory": directory, "filename": filename,
+                      "kind": kind, "stamp": stamp})
+    return items
+
+
+def main():
+    connect()
+    db.ensure_schema()
+    rollups.ensure_rollup_schema()
+    metrics.serve(METRICS_PORT)
+    load_checkpoint()
+    load_ai_log_offset()
+    watcher = DirWatcher([frames_dir, logs_dir])
+    if watcher.event_driven:
+        print("📱 Listening for incoming files (inotify)...")
+    else:
+        print("📱 Listening for incoming files (polling)...")
+
+    queued = {}
+    first_queued = None
+    last_ai_check = 0
+    last_maintenance = 0
+
+    # One-time catch-up for everything that arrived while we were down
+    arrivals = watcher.scan()
+    while True:
+        try:
+            # Queue new files before touching the DB, so events read while it is down are kept
+            for directory, filename in arrivals:
+                kind = classify(directory, filename)
+                if kind is not None:
+                    queued[os.path.join(directory, filename)] = (directory, filename, kind)
+            arrivals = []
+            if queued and first_queued is None:
+                first_queued = time.monotonic()
+            if conn is None:
+                connect()
+
+            now = time.monotonic()
+            if queued and (len(queued) >= BATCH_MAX_SIZE or now - first_queued >= BATCH_MAX_LATENCY):
+                items = collect_items(queued)
+                queued = {}
+                first_queued = None
+                retry = []
+                for i in range(0, len(items), BATCH_MAX_SIZE):
+                    retry += flush_batch(items[i:i + BATCH_MAX_SIZE])
+                for item in retry:
+                    queued[item["path"]] = (item["directory"], item["filename"], item["kind"])
+
+            if now - last_ai_check >= POLL_INTERVAL:
+                process_ai_log()
+                last_ai_check = now
+
+            if now - last_maintenance >= rollups.PRUNE_INTERVAL:
+                rollups.maintain(conn)
+                last_maintenance = now
+
+            queue_depth.set(len(queued))
+            timeout = POLL_INTERVAL
+            if first_queued is not None:
+                timeout = max(0.0, min(timeout, first_queued + BATCH_MAX_LATENCY - time.monotonic()))
+            arrivals = watcher.read(timeout)
+        except KeyboardInterrupt:
+            print("🚫 Program terminated.")
+            break
+        except Exception as e:
+            reset_connection()
+            print(f"[HATA] General loop error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    watcher.close()
 
-    time.sleep(1)
 
-cur.close()
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
+    if conn is not None:
+        cur.close()
+        conn.close()
@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import serial
+
+# DATA:Gyro=0.12,-0.40,9.81 | ServoAngles=90,45 | Distance(cm)=Front:120 Left:35 Right:48 | MotorState=FORWARD
+DATA_RE = re.compile(
+    r"DATA:\s*Gyro=(?P<gx>[^,|]+),(?P<gy>[^,|]+),(?P<gz>[^|]+?)\s*\|\s*"
+    r"ServoAngles=(?P<neck>[^,|]+),(?P<head>[^|]+?)\s*\|\s*"
+    r"Distance\(cm\)=(?P<dist>[^|]*?)\s*\|\s*"
+    r"MotorState=(?P<motor>\S*)"
+)
+DISTANCE_RE = re.compile(r"(\w+):(-?[\d.]+)")
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# Old split-based parser, kept for lines that do not match DATA_RE (missing/reordered fields)
+def parse_arduino_legacy(line):
+    data = {}
+    parts = line.replace("DATA:", "").split(" | ")
+    for part in parts:
+        if part.startswith("Gyro="):
+            gx, gy, gz = part.split("=")[1].split(",")
+            data["Gyro"] = {"X": to_number(gx), "Y": to_number(gy), "Z": to_number(gz)}
+        elif part.startswith("ServoAngles="):
+            n, h = part.split("=")[1].split(",")
+            data["ServoAngles"] = {"Neck": to_number(n), "Head": to_number(h)}
+        elif part.startswith("Distance(cm)="):
+            d = part.split("=")[1].split(" ")
+            data["Distances"] = {kv.split(":")[0]: to_number(kv.split(":")[1]) for kv in d}
+        elif part.startswith("MotorState="):
+            data["MotorState"] = part.split("=")[1]
+    return data
+
+
+# One regex match per line; fields are converted to numbers once, here.
+def parse_arduino(line, timestamp=None):
+    m = DATA_RE.match(line)
+    if m is None:
+        data = parse_arduino_legacy(line)
+    else:
+        data = {
+            "Gyro": {"X": to_number(m["gx"]), "Y": to_number(m["gy"]), "Z": to_number(m["gz"])},
+            "ServoAngles": {"Neck": to_number(m["neck"]), "Head": to_number(m["head"])},
+            "Distances": {k: float(v) for k, v in DISTANCE_RE.findall(m["dist"])},
+            "MotorState": m["motor"],
+        }
+    data["Timestamp"] = (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    return data
+
+
+# ==== ÖRNEK AZALTMA ====
+# "all": ship every sample, "decimate": every n-th sample, "mean": average of each n samples
+def downsample(samples, mode="all", n=1):
+    if mode == "all" or n <= 1:
+        return samples
+    if mode == "decimate":
+        return samples[n - 1::n]
+    if mode == "mean":
+        return [mean_sample(samples[i:i + n]) for i in range(0, len(samples), n)]
+    raise ValueError(f"Unknown downsample mode: {mode}")
+
+
+def mean_sample(group):
+    last = group[-1]
+    out = {"Timestamp": last["Timestamp"], "MotorState": last.get("MotorState"), "Samples": len(group)}
+    for key in ("Gyro", "ServoAngles", "Distances"):
+        fields = {}
+        for sample in group:
+            for name, value in sample.get(key, {}).items():
+                if value is not None:
+                    fields.setdefault(name, []).append(value)
+        out[key] = {name: sum(values) / len(values) for name, values in fields.items()}
+    return out
+
+
+# Drains the serial port continuously in its own thread and keeps the parsed samples
+# in a bounded ring buffer (oldest samples are dropped if nobody collects them).
+# The port is a plain path, so a pty pair can stand in for the Arduino in tests.
+class ArduinoReader:
+    def __init__(self, port, baud=9600, buffer_size=4096):
+        self.port = port
+        self.baud = baud
+        self.samples = deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+        self.lines = 0
+        self.bad_lines = 0
+        self.dropped = 0
+        self.connected = threading.Event()  # set while the port is open
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                with serial.Serial(self.port, self.baud, timeout=0.2) as ser:
+                    print(f"[Arduino] Reading {self.port} @ {self.baud}")
+                    self.connected.set()
+                    try:
+                        self._read_loop(ser)
+                    finally:
+                        self.connected.clear()
+            except (serial.SerialException, OSError) as e:
+                print(f"[Arduino] Serial error: {e} → retrying in 2 s")
+                time.sleep(2)
+            except Exception as e:
+                # Never let one unexpected error end the reader thread for good
+                print(f"[Arduino] Reader error: {e!r} → restarting in 2 s")
+                time.sleep(2)
+
+    def _read_loop(self, ser):
+        buf = b""
+        while not self.stopped.is_set():
+            chunk = ser.read(ser.in_waiting or 1)
+            if not chunk:
+                continue
+            now = datetime.now()
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for raw in lines:
+                self._handle_line(raw, now)
+
+    def _handle_line(self, raw, now):
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line.startswith("DATA:"):
+            return
+        self.lines += 1
+        try:
+            sample = parse_arduino(line, now)
+        except (ValueError, IndexError):
+            # Serial noise: truncated fields, "Front" without ":<cm>", ...
+            self.bad_lines += 1
+            return
+        with self.lock:
+            if len(self.samples) == self.samples.maxlen:
+                self.dropped += 1
+            self.samples.append(sample)
+
+    # Returns and clears everything collected since the last call
+    def drain(self):
+        with self.lock:
+            samples = list(self.samples)
+            self.samples.clear()
+        return samples
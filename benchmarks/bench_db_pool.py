@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# Image_Data lookups against a local PostgreSQL: connect-per-call vs the shared pool in db.py.
+#
+#   python benchmarks/bench_db_pool.py --url postgresql+psycopg2://user:pw@localhost/robot_db
+#
+# Everything runs in a scratch schema (bench_db_pool, dropped afterwards) reached through
+# search_path, so the real tables are never touched. Compared, with --threads concurrent callers:
+#   - connect per call:   a fresh connection for every lookup (what full_api.py did before)
+#   - pooled, text():     db.make_engine() with the usual SQLAlchemy text() query
+#   - pooled, prepared:   db.make_engine() + db.run_prepared("image_ids_by_path")
+# The prepared lookup is measured once more before the db.SCHEMA_INDEXES exist.
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+import db
+
+SCHEMA = "bench_db_pool"
+
+
+def setup(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"""
+            CREATE TABLE {SCHEMA}.Image_Data (
+                imageid SERIAL PRIMARY KEY,
+                ImageTime TIMESTAMP,
+                ImagePath TEXT,
+                Robot_LocationID INTEGER,
+                RobotID INTEGER,
+                ObjectID INTEGER
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE {SCHEMA}.ai_results (
+                resultid SERIAL PRIMARY KEY,
+                date TIMESTAMP,
+                anomalystatus BOOLEAN,
+                robot_locationid INTEGER,
+                imageid INTEGER,
+                robotid INTEGER,
+                gps_id INTEGER,
+                objectid INTEGER,
+                description TEXT
+            )
+        """))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.Image_Data (ImageTime, ImagePath, Robot_LocationID, RobotID, ObjectID)
+            SELECT now(), '/home/mergen/Desktop/db/Images/photo_' || g || '.jpg', 2, 2, 2
+            FROM generate_series(1, :rows) AS g
+        """), {"rows": rows})
+        conn.execute(text(f"ANALYZE {SCHEMA}.Image_Data"))
+
+
+# With a NullPool engine every call opens and closes its own connection
+def lookup_text(engine, path):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT imageid, ImagePath FROM Image_Data WHERE ImagePath = ANY(:paths)"),
+                            {"paths": [path]}).fetchall()
+
+
+def lookup_pooled_prepared(engine, path):
+    with engine.connect() as conn:
+        return db.run_prepared(conn.connection, "image_ids_by_path", [path])
+
+
+def run(lookup, engine, rows, lookups, threads):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = lookups // threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        mine = []
+        for _ in range(per_thread):
+            path = f"/home/mergen/Desktop/db/Images/photo_{rng.randint(1, rows)}.jpg"
+            started = time.perf_counter()
+            assert lookup(engine, path)
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    lookup(engine, "warm-up")
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return (len(latencies) / elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=db.DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the scratch Image_Data")
+    parser.add_argument("--lookups", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    connect_args = {"options": f"-csearch_path={SCHEMA}"}
+    admin = create_engine(args.url, poolclass=NullPool)
+    setup(admin, args.rows)
+
+    per_call = create_engine(args.url, poolclass=NullPool, connect_args=connect_args)
+    pooled = db.make_engine(args.url, connect_args=connect_args)
+    results = []
+    try:
+        results.append(("pooled, prepared, no index",
+                        run(lookup_pooled_prepared, pooled, args.rows, args.lookups, args.threads)))
+        with pooled.begin() as conn:
+            for statement in db.SCHEMA_INDEXES:
+                conn.execute(text(statement))
+            conn.execute(text("ANALYZE Image_Data"))
+        results.append(("connect per call",
+                        run(lookup_text, per_call, args.rows, args.lookups, args.threads)))
+        results.append(("pooled, text()",
+                        run(lookup_text, pooled, args.rows, args.lookups, args.threads)))
+        results.append(("pooled, prepared",
+                        run(lookup_pooled_prepared, pooled, args.rows, args.lookups, args.threads)))
+    finally:
+        pooled.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    print(f"{args.lookups} Image_Data lookups by path over {args.rows} rows, {args.threads} threads:")
+    baseline = results[1][1][0]
+    for name, (rate, p50, p99) in results:
+        print(f"  {name:28s} {rate:9.0f} lookups/s  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms"
+              f"  ({rate / baseline:.1f}x connect per call)")
+
+
+if __name__ == "__main__":
+    main()
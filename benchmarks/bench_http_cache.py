@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# Bandwidth of a repeated dashboard load against webapi.py, before/after HTTP caching.
+#
+#   python benchmarks/bench_http_cache.py --frames 200 --size-kb 450
+#
+# A "dashboard load" is GET /images?limit=N followed by GET /image/<name> for every frame.
+# Three clients are compared on the second load:
+#   - no cache:      what the old FileResponse forced (every JPEG downloaded again)
+#   - revalidating:  browser sends If-None-Match and gets 304s
+#   - immutable:     browser honours Cache-Control: immutable and sends nothing for frames
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.testclient import TestClient
+
+import webapi
+from file_index import FileIndex
+
+
+def make_frames(folder, count, size_kb):
+    payload = b"\xff\xd8" + os.urandom(size_kb * 1024 - 4) + b"\xff\xd9"
+    for i in range(count):
+        name = f"photo_20250101_{12 + i // 3600:02d}{i // 60 % 60:02d}{i % 60:02d}_000.jpg"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(payload)
+
+
+def wire_bytes(response):
+    header_bytes = sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+    return header_bytes + len(response.content)
+
+
+def dashboard_load(client, limit, etags=None, immutable_cache=None):
+    total = 0
+    requests = 0
+    started = time.perf_counter()
+    listing = client.get(f"/images?limit={limit}")
+    total += wire_bytes(listing)
+    requests += 1
+    for item in listing.json():
+        url = item["url"]
+        if immutable_cache is not None and url in immutable_cache:
+            continue
+        headers = {}
+        if etags is not None and url in etags:
+            headers["If-None-Match"] = etags[url]
+        res = client.get(url, headers=headers)
+        total += wire_bytes(res)
+        requests += 1
+        if etags is not None and "etag" in res.headers:
+            etags[url] = res.headers["etag"]
+        if immutable_cache is not None and "immutable" in res.headers.get("cache-control", ""):
+            immutable_cache.add(url)
+    return total, requests, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=450, help="size of one 1920x1080 JPEG")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as images, tempfile.TemporaryDirectory() as logs, \
+            tempfile.TemporaryDirectory() as thumbs:
+        make_frames(images, args.frames, args.size_kb)
+        webapi.IMAGE_FOLDER = images
+        webapi.LOG_FOLDER = logs
+        webapi.THUMB_FOLDER = thumbs
+        webapi.image_index = FileIndex(images, ".jpg")
+        webapi.log_index = FileIndex(logs, webapi.LOG_SUFFIXES)
+
+        with TestClient(webapi.app) as client:
+            cold, cold_reqs, cold_t = dashboard_load(client, args.frames)
+            plain, plain_reqs, plain_t = dashboard_load(client, args.frames)
+
+            etags = {}
+            dashboard_load(client, args.frames, etags=etags)
+            reval, reval_reqs, reval_t = dashboard_load(client, args.frames, etags=etags)
+
+            cache = set()
+            dashboard_load(client, args.frames, immutable_cache=cache)
+            immut, immut_reqs, immut_t = dashboard_load(client, args.frames, immutable_cache=cache)
+
+    print(f"{args.frames} frames x {args.size_kb} KB, bytes on the wire for a repeated dashboard load:")
+    print(f"  first load            {cold / 1024:10.1f} KB  {cold_reqs:5d} req  {cold_t * 1000:8.1f} ms")
+    print(f"  reload, no cache      {plain / 1024:10.1f} KB  {plain_reqs:5d} req  {plain_t * 1000:8.1f} ms")
+    print(f"  reload, revalidating  {reval / 1024:10.1f} KB  {reval_reqs:5d} req  {reval_t * 1000:8.1f} ms"
+          f"  ({100 * (1 - reval / plain):.1f}% saved)")
+    print(f"  reload, immutable     {immut / 1024:10.1f} KB  {immut_reqs:5d} req  {immut_t * 1000:8.1f} ms"
+          f"  ({100 * (1 - immut / plain):.1f}% saved)")
+
+
+if __name__ == "__main__":
+    main()
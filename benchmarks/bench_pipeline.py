@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+# End-to-end load test of the Pi4 side: UL.py ingest → full_api.py AI upload → ai_results,
+# with webapi.py serving reads at the same time.
+#
+#   python benchmarks/bench_pipeline.py --database-url postgresql+psycopg2://postgres@localhost/robot_bench \
+#       --rate 5 --duration 60 --clients 8
+#
+# Runs on a plain Linux box with a local PostgreSQL (point it at a scratch database):
+#   1. creates the robot tables if they are missing,
+#   2. starts a stub AI endpoint plus UL.py, full_api.py and webapi.py as subprocesses, with
+#      ROBOT_* variables (config.py) pointing at a temporary data dir and the stub,
+#   3. replays synthetic frames, Arduino segments and Pi5_Latest.json into Images/ and Logs/
+#      at the target rate; the stub answers every upload with a row in ai_log.txt,
+#   4. load-tests webapi.py's listing and file routes with --clients threads,
+#   5. reports sustained throughput, p50/p99 latencies and CPU/RSS of every service.
+# Per-stage latencies come from the services' own /metrics (see metrics.py).
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import psutil
+import requests
+from PIL import Image
+from sqlalchemy import create_engine, make_url, text
+
+import config
+from segments import SegmentWriter
+
+# Tables the services expect on the robots; only created when missing
+ROBOT_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS Image_Data (
+        imageid SERIAL PRIMARY KEY, ImageTime TIMESTAMP, ImagePath TEXT,
+        Robot_LocationID INTEGER, RobotID INTEGER, ObjectID INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS Logs (
+        logid SERIAL PRIMARY KEY, LogTime TIMESTAMP, Action TEXT, UserID INTEGER, LogFilePath TEXT)""",
+    """CREATE TABLE IF NOT EXISTS arduino_logs (
+        timestamp TIMESTAMP, gyrox REAL, gyroy REAL, gyroz REAL, neckservo REAL, headservo REAL,
+        frontdistance REAL, leftdistance REAL, rightdistance REAL, motorstate TEXT)""",
+    """CREATE TABLE IF NOT EXISTS pi5_stats (
+        timestamp TIMESTAMP, cpu REAL, ram REAL, cpu_temp REAL, gpu_temp REAL,
+        upload_speed REAL, download_speed REAL)""",
+    """CREATE TABLE IF NOT EXISTS ai_results (
+        resultid SERIAL PRIMARY KEY, date TIMESTAMP, anomalystatus BOOLEAN, robot_locationid INTEGER,
+        imageid INTEGER, robotid INTEGER, gps_id INTEGER, objectid INTEGER, description TEXT)""",
+    """CREATE TABLE IF NOT EXISTS object (
+        objectid SERIAL PRIMARY KEY, objectname TEXT, initial_latitude REAL, initial_longitude REAL,
+        new_latitude REAL, new_longitude REAL, time TIMESTAMP)""",
+]
+
+IMAGEID_RE = re.compile(rb'name="imageid"\r\n\r\n(\d+)')
+FILENAME_RE = re.compile(rb'filename="([^"]+)"')
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# ==== STUB AI ====
+# Accepts full_api.py uploads like the AI PC does and appends a result row to ai_log.txt,
+# which UL.py tails into ai_results.
+class StubAI:
+    def __init__(self, port, ai_log_path, delay):
+        self.received = {}      # filename -> time received
+        self.lock = threading.Lock()
+        self.ai_log_path = ai_log_path
+        self.delay = delay
+        with open(ai_log_path, "w") as f:
+            f.write("imageid,timestamp,mse,anomaly,objects\n")
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                stub.record(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b'{"status": "ok"}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def record(self, body):
+        imageid = IMAGEID_RE.search(body)
+        filename = FILENAME_RE.search(body)
+        now = time.time()
+        with self.lock:
+            if filename:
+                self.received.setdefault(filename.group(1).decode(), now)
+            if imageid:
+                row = io.StringIO()
+                csv.writer(row).writerow([imageid.group(1).decode(), datetime.now().isoformat(), "0.01",
+                                          random.random() < 0.1, "person"])
+                with open(self.ai_log_path, "a") as f:
+                    f.write(row.getvalue())
+
+
+# ==== REPLAY ====
+# Writes frames (atomic rename, like the SFTP upload), Arduino segments and Pi5 stats.
+class Replayer:
+    def __init__(self, data_dir, rate, frame_size, arduino_hz):
+        self.images = os.path.join(data_dir, "Images")
+        self.logs = os.path.join(data_dir, "Logs")
+        self.tmp = os.path.join(data_dir, ".replay")
+        os.makedirs(self.tmp, exist_ok=True)
+        self.rate = rate
+        self.arduino_hz = arduino_hz
+        self.written = {}       # filename -> time written
+        self.names = []
+        self.lock = threading.Lock()
+        frame = np.random.default_rng(0).integers(0, 255, (frame_size[1], frame_size[0], 3), dtype=np.uint8)
+        out = io.BytesIO()
+        Image.fromarray(frame).save(out, "JPEG", quality=90)
+        self.jpeg = out.getvalue()
+        self.segments = SegmentWriter(os.path.join(self.tmp, "segments"), self.logs, "Arduino",
+                                      on_ready=lambda path: None, max_samples=600, max_age=5)
+
+    def write_frame(self):
+        now = datetime.now()
+        name = f"photo_{now.strftime('%Y%m%d_%H%M%S_%f')[:-3]}.jpg"
+        tmp = os.path.join(self.tmp, name)
+        with open(tmp, "wb") as f:
+            f.write(self.jpeg)
+        os.replace(tmp, os.path.join(self.images, name))
+        with self.lock:
+            self.written[name] = time.time()
+            self.names.append(name)
+
+    def write_pi5(self):
+        stats = {"CPU": random.uniform(5, 90), "RAM": random.uniform(20, 80), "CPU Temp": random.uniform(40, 70),
+                 "GPU Temp": random.uniform(40, 70), "Upload (KB/s)": random.uniform(0, 2000),
+                 "Download (KB/s)": random.uniform(0, 200), "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        tmp = os.path.join(self.tmp, "Pi5_Latest.json")
+        with open(tmp, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, os.path.join(self.logs, "Pi5_Latest.json"))
+
+    def arduino_sample(self):
+        return {"Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                "Gyro": {"X": random.gauss(0, 1), "Y": random.gauss(0, 1), "Z": random.gauss(0, 1)},
+                "ServoAngles": {"Neck": random.randint(0, 180), "Head": random.randint(0, 180)},
+                "Distances": {"Front": random.uniform(5, 300), "Left": random.uniform(5, 300),
+                              "Right": random.uniform(5, 300)},
+                "MotorState": random.choice(["FORWARD", "STOP", "LEFT", "RIGHT"])}
+
+    def run(self, duration):
+        started = time.monotonic()
+        next_frame = next_sample = started
+        next_pi5 = started
+        while time.monotonic() - started < duration:
+            now = time.monotonic()
+            if now >= next_frame:
+                self.write_frame()
+                next_frame += 1.0 / self.rate
+            while self.arduino_hz and next_sample <= now:
+                self.segments.append(self.arduino_sample())
+                next_sample += 1.0 / self.arduino_hz
+            self.segments.maybe_rotate()
+            if now >= next_pi5:
+                self.write_pi5()
+                next_pi5 += 5
+            due = [next_frame, next_pi5] + ([next_sample] if self.arduino_hz else [])
+            time.sleep(max(0.0, min(due) - time.monotonic()))
+        self.segments.rotate()
+
+
+# ==== WEBAPI LOAD ====
+WEBAPI_ROUTES = [("/images", 0.3), ("/image/{name}", 0.4), ("/thumb/{name}", 0.2), ("/logs", 0.1)]
+
+
+def webapi_client(base, replayer, stop, results, lock):
+    session = requests.Session()
+    mine = []
+    while not stop.is_set():
+        route = random.choices([r for r, _ in WEBAPI_ROUTES], [w for _, w in WEBAPI_ROUTES])[0]
+        with replayer.lock:
+            name = random.choice(replayer.names) if replayer.names else None
+        if "{name}" in route and name is None:
+            time.sleep(0.1)
+            continue
+        url = base + (route.format(name=name) if "{name}" in route else route + "?limit=100")
+        started = time.perf_counter()
+        try:
+            status = session.get(url, timeout=30).status_code
+        except requests.RequestException:
+            status = 0
+        mine.append((route, time.perf_counter() - started, status))
+    with lock:
+        results.extend(mine)
+
+
+# ==== SERVICES ====
+class Service:
+    def __init__(self, name, cmd, env, log_dir, ready_url):
+        self.name = name
+        self.log = open(os.path.join(log_dir, f"{name}.log"), "w")
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        self.ps = psutil.Process(self.proc.pid)
+        self.ready_url = ready_url
+        self.cpu = []
+        self.rss = []
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.name} exited, see {self.log.name}")
+            try:
+                if requests.get(self.ready_url, timeout=1).status_code < 500:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.3)
+        raise RuntimeError(f"{self.name} not ready after {timeout}s, see {self.log.name}")
+
+    def sample(self):
+        try:
+            self.cpu.append(self.ps.cpu_percent(interval=None))
+            self.rss.append(self.ps.memory_info().rss)
+        except psutil.NoSuchProcess:
+            pass
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.log.close()
+
+
+# Prometheus text → quantile of a histogram (linear within the bucket, like histogram_quantile)
+def scrape_quantile(url, name, q, **labels):
+    try:
+        body = requests.get(url, timeout=5).text
+    except requests.RequestException:
+        return float("nan")
+    buckets = []
+    want = [f'{k}="{v}"' for k, v in labels.items()]
+    for line in body.splitlines():
+        if line.startswith(f"{name}_bucket{{") and all(w in line for w in want):
+            le = line.split('le="')[1].split('"')[0]
+            buckets.append((float("inf") if le == "+Inf" else float(le), float(line.rsplit(" ", 1)[1])))
+    if not buckets or buckets[-1][1] == 0:
+        return float("nan")
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", required=True, help="scratch database; tables are created and filled")
+    parser.add_argument("--data-dir", help="defaults to a temporary directory")
+    parser.add_argument("--rate", type=float, default=5, help="frames per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of replay")
+    parser.add_argument("--drain", type=float, default=30, help="max seconds to wait for the tail")
+    parser.add_argument("--arduino-hz", type=float, default=50, help="Arduino samples per second")
+    parser.add_argument("--frame-size", default="1920x1080")
+    parser.add_argument("--ai-delay", type=float, default=0.05, help="stub AI processing time (s)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent webapi clients")
+    parser.add_argument("--base-port", type=int, default=18500)
+    args = parser.parse_args()
+    # Never load-test the robot's own database
+    if make_url(args.database_url).database == make_url(config.PRODUCTION_DATABASE_URL).database:
+        parser.error("--database-url points at the production database; use a scratch database")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="robot_bench_")
+    for sub in ("Images", "Logs", "Thumbs"):
+        os.makedirs(os.path.join(data_dir, sub), exist_ok=True)
+    engine = create_engine(args.database_url)
+    with engine.begin() as conn:
+        for statement in ROBOT_SCHEMA:
+            conn.execute(text(statement))
+    engine.dispose()
+
+    stub_port, api_port, webapi_port, ul_metrics = (args.base_port + i for i in range(4))
+    stub = StubAI(stub_port, os.path.join(data_dir, "Logs", "ai_log.txt"), args.ai_delay)
+    env = dict(os.environ, ROBOT_DATA_DIR=data_dir, ROBOT_DATABASE_URL=args.database_url,
+               ROBOT_AI_ENDPOINT=f"http://127.0.0.1:{stub_port}/upload-image",
+               ROBOT_FULL_API_PORT=str(api_port), ROBOT_UL_METRICS_PORT=str(ul_metrics), PYTHONUNBUFFERED="1")
+    print(f"[BENCH] data dir {data_dir}, service logs next to it")
+
+    services = []
+    try:
+        services.append(Service("UL", [sys.executable, "UL.py"], env, data_dir,
+                                f"http://127.0.0.1:{ul_metrics}/metrics"))
+        services.append(Service("full_api", [sys.executable, "full_api.py"], env, data_dir,
+                                f"http://127.0.0.1:{api_port}/metrics"))
+        services.append(Service("webapi", [sys.executable, "-m", "uvicorn", "webapi:app", "--port",
+                                           str(webapi_port), "--log-level", "warning"], env, data_dir,
+                                f"http://127.0.0.1:{webapi_port}/"))
+        for service in services:
+            service.wait_ready()
+            service.sample()
+
+        width, height = (int(v) for v in args.frame_size.split("x"))
+        replayer = Replayer(data_dir, args.rate, (width, height), args.arduino_hz)
+        stop = threading.Event()
+        results, results_lock = [], threading.Lock()
+        clients = [threading.Thread(target=webapi_client,
+                                    args=(f"http://127.0.0.1:{webapi_port}", replayer, stop, results, results_lock))
+                   for _ in range(args.clients)]
+        replay = threading.Thread(target=replayer.run, args=(args.duration,))
+
+        started = time.monotonic()
+        replay.start()
+        for t in clients:
+            t.start()
+        while replay.is_alive():
+            for service in services:
+                service.sample()
+            replay.join(timeout=1)
+        replay_elapsed = time.monotonic() - started
+        stop.set()
+        for t in clients:
+            t.join()
+
+        # Let the pipeline finish the frames written during the run
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline and len(stub.received) < len(replayer.written):
+            for service in services:
+                service.sample()
+            time.sleep(1)
+        total_elapsed = time.monotonic() - started
+
+        # ==== REPORT ====
+        e2e = [stub.received[n] - t for n, t in replayer.written.items() if n in stub.received]
+        print(f"\n{len(replayer.written)} frames written in {replay_elapsed:.0f}s "
+              f"({len(replayer.written) / replay_elapsed:.2f}/s target {args.rate}/s), "
+              f"{len(stub.received)} reached the AI stub "
+              f"({len(stub.received) / total_elapsed:.2f}/s sustained incl. drain)")
+        print(f"  write → AI upload      p50 {percentile(e2e, 0.5):7.3f} s  p99 {percentile(e2e, 0.99):7.3f} s")
+        ul_url = f"http://127.0.0.1:{ul_metrics}/metrics"
+        api_url = f"http://127.0.0.1:{api_port}/metrics"
+        for label, url, name, stage in [
+            ("capture → ingested", ul_url, "frame_stage_seconds", {"stage": "ingested"}),
+            ("capture → AI upload", api_url, "frame_stage_seconds", {"stage": "ai_uploaded"}),
+            ("capture → ai_results", ul_url, "frame_stage_seconds", {"stage": "ai_result"}),
+            ("UL file pickup", ul_url, "ul_pickup_seconds", {}),
+            ("UL batch DB time", ul_url, "ul_batch_seconds", {}),
+            ("AI POST", api_url, "ai_upload_seconds", {}),
+        ]:
+            print(f"  {label:22s} p50 {scrape_quantile(url, name, 0.5, **stage):7.3f} s"
+                  f"  p99 {scrape_quantile(url, name, 0.99, **stage):7.3f} s")
+
+        print(f"\nwebapi.py, {args.clients} clients for {replay_elapsed:.0f}s:")
+        for route, _ in WEBAPI_ROUTES:
+            lat = [sec for r, sec, _ in results if r == route]
+            errors = sum(1 for r, _, status in results if r == route and status != 200)
+            print(f"  {route:16s} {len(lat) / replay_elapsed:8.1f} req/s  p50 {percentile(lat, 0.5) * 1000:8.1f} ms"
+                  f"  p99 {percentile(lat, 0.99) * 1000:8.1f} ms  {errors} errors")
+
+        print("\nresources:")
+        for service in services:
+            cpu = statistics.mean(service.cpu[1:]) if len(service.cpu) > 1 else float("nan")
+            print(f"  {service.name:10s} CPU {cpu:6.1f} %  peak RSS {max(service.rss) / 1024 / 1024:7.1f} MB")
+    finally:
+        for service in services:
+            service.stop()
+        stub.server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import io
+import os
+import queue
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+# ==== KAYNAKLAR ====
+# Every source yields (capture_time, frame) where frame is JPEG bytes or an RGB numpy array.
+
+# Keeps one libcamera-vid (rpicam-vid) process open and splits its MJPEG stdout into frames,
+# so the camera stack is initialised once instead of once per photo.
+class LibcameraMjpegSource:
+    def __init__(self, width, height, fps, command="libcamera-vid"):
+        self.cmd = [command, "-t", "0", "--codec", "mjpeg", "--nopreview",
+                    "--width", str(width), "--height", str(height),
+                    "--framerate", str(max(fps, 1)), "-o", "-"]
+
+    def frames(self):
+        while True:
+            proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+            print(f"[Camera] {self.cmd[0]} started (pid {proc.pid})")
+            buf = b""
+            try:
+                while True:
+                    chunk = proc.stdout.read(65536)
+                    if not chunk:
+                        break
+                    buf += chunk
+                    while True:
+                        start = buf.find(JPEG_SOI)
+                        end = buf.find(JPEG_EOI, start + 2) if start >= 0 else -1
+                        if end < 0:
+                            if start > 0:
+                                buf = buf[start:]
+                            break
+                        yield datetime.now(), buf[start:end + 2]
+                        buf = buf[end + 2:]
+            finally:
+                proc.kill()
+                proc.wait()
+            print("[Camera] libcamera-vid exited → restarting in 2 s")
+            time.sleep(2)
+
+
+# picamera2 session kept open; frames come back as arrays and are JPEG-encoded by the writer.
+# picamera2 names formats by libcamera's little-endian convention: "BGR888" arrays hold
+# pixels as [R, G, B], which is what Image.fromarray expects ("RGB888" would swap red/blue).
+class Picamera2Source:
+    def __init__(self, width, height, fps):
+        self.cam = Picamera2()
+        config = self.cam.create_video_configuration(main={"size": (width, height), "format": "BGR888"},
+                                                     controls={"FrameRate": max(fps, 1)})
+        self.cam.configure(config)
+
+    def frames(self):
+        self.cam.start()
+        while True:
+            yield datetime.now(), self.cam.capture_array("main")
+
+
+# Synthetic frames (noise background + a moving square) for running without a camera
+class FakeFrameSource:
+    def __init__(self, width, height, fps):
+        import numpy as np
+        self.np = np
+        self.width = width
+        self.height = height
+        self.period = 1.0 / fps if fps > 0 else 0
+        self.rng = np.random.default_rng(0)
+        self.background = self.rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+
+    def frames(self):
+        n = 0
+        while True:
+            frame = self.background.copy()
+            size = max(8, self.height // 8)
+            x = (n * size // 2) % max(1, self.width - size)
+            frame[self.height // 3:self.height // 3 + size, x:x + size] = 255
+            yield datetime.now(), frame
+            n += 1
+            if self.period:
+                time.sleep(self.period)
+
+
+def make_frame_source(backend, width, height, fps):
+    if backend == "picamera2":
+        if Picamera2 is None:
+            print("[Camera] picamera2 is not installed → using libcamera-vid")
+        else:
+            return Picamera2Source(width, height, fps)
+    if backend == "fake":
+        return FakeFrameSource(width, height, fps)
+    return LibcameraMjpegSource(width, height, fps)
+
+
+# ==== BORU HATTI ====
+# capture thread: reads the source, keeps frames at the target fps, bounded queue (oldest dropped)
+# writer thread:  asks the optional gate (change detection) whether to keep the frame,
+#                 JPEG-encodes if needed, writes atomically, then calls on_frame(path)
+class CameraPipeline:
+    def __init__(self, source, out_dir, tmp_dir, on_frame, target_fps=1.0, queue_size=8, jpeg_quality=90,
+                 gate=None):
+        self.source = source
+        self.gate = gate
+        self.out_dir = out_dir
+        self.tmp_dir = tmp_dir
+        self.on_frame = on_frame
+        self.min_interval = 1.0 / target_fps if target_fps > 0 else 0
+        self.jpeg_quality = jpeg_quality
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.captured = 0
+        self.dropped = 0
+        os.makedirs(out_dir, exist_ok=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._capture_loop, daemon=True).start()
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+
+    def _capture_loop(self):
+        # Fixed schedule with a little slack, so a source running at exactly the target
+        # rate is not halved by jitter; after a stall the schedule restarts from now.
+        slack = self.min_interval / 4
+        next_due = None
+        for captured_at, frame in self.source.frames():
+            now = time.monotonic()
+            if next_due is not None and now < next_due - slack:
+                continue
+            if next_due is None or now > next_due + self.min_interval:
+                next_due = now
+            next_due += self.min_interval
+            self.captured += 1
+            try:
+                self.queue.put_nowait((captured_at, frame))
+            except queue.Full:
+                # Writer is behind: drop the oldest frame, keep the fresh one
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                self.queue.put_nowait((captured_at, frame))
+
+    def encode(self, frame):
+        if isinstance(frame, (bytes, bytearray)):
+            return frame
+        from PIL import Image
+        out = io.BytesIO()
+        Image.fromarray(frame).save(out, "JPEG", quality=self.jpeg_quality)
+        return out.getvalue()
+
+    def _writer_loop(self):
+        while True:
+            captured_at, frame = self.queue.get()
+            try:
+                filename = f"photo_{captured_at.strftime('%Y%m%d_%H%M%S_%f')[:-3]}.jpg"
+                if self.gate is not None and not self.gate(captured_at, frame, filename):
+                    continue
+                data = self.encode(frame)
+                tmp = os.path.join(self.tmp_dir, filename)
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                path = os.path.join(self.out_dir, filename)
+                os.replace(tmp, path)
+                print(f"[Frame] Captured → {filename}")
+                self.on_frame(path)
+            except Exception as e:
+                print(f"[Camera] Frame could not be written: {e}")
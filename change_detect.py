@@ -0,0 +1,68 @@
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+# Frames are compared as tiny grayscale thumbnails; 64x36 keeps the 16:9 aspect of 1920x1080
+DETECT_SIZE = (64, 36)
+
+
+def small_gray(frame, size=DETECT_SIZE):
+    if isinstance(frame, (bytes, bytearray)):
+        im = Image.open(io.BytesIO(frame))
+        im.draft("L", (size[0] * 4, size[1] * 4))   # JPEG decoder downscales while decoding
+    else:
+        im = Image.fromarray(frame)
+    return np.asarray(im.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+# Decides whether a frame is worth shipping. Each frame is compared with a rolling
+# (exponentially averaged) background; the score is the % of pixels whose brightness
+# differs by more than `pixel_delta`. Frames above `threshold` are forwarded, plus one
+# keyframe every `keyframe_interval` seconds so a static scene is still covered.
+class ChangeDetector:
+    def __init__(self, threshold=1.0, pixel_delta=20, keyframe_interval=60, alpha=0.05, audit=None):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.keyframe_interval = keyframe_interval
+        self.alpha = alpha
+        self.audit = audit          # optional SegmentWriter for the decision log
+        self.background = None
+        self.last_forwarded = None
+        self.forwarded = 0
+        self.skipped = 0
+
+    def check(self, captured_at, frame, name=None):
+        small = small_gray(frame)
+        now = time.monotonic()
+
+        if self.background is None:
+            self.background = small
+            score, reason = 100.0, "first"
+        else:
+            diff = np.abs(small - self.background)
+            score = float(np.count_nonzero(diff > self.pixel_delta)) * 100.0 / diff.size
+            self.background += self.alpha * (small - self.background)
+            if score >= self.threshold:
+                reason = "change"
+            elif now - self.last_forwarded >= self.keyframe_interval:
+                reason = "keyframe"
+            else:
+                reason = None
+
+        forward = reason is not None
+        if forward:
+            self.last_forwarded = now
+            self.forwarded += 1
+        else:
+            self.skipped += 1
+        if self.audit is not None:
+            self.audit.append({
+                "Timestamp": captured_at.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                "Frame": name,
+                "Score": round(score, 3),
+                "Forwarded": forward,
+                "Reason": reason or "static",
+            })
+        return forward, score
@@ -0,0 +1,95 @@
+import psycopg2
+from sqlalchemy import create_engine, text
+
+import config
+
+# Shared data access for UL.py, full_api.py and webapi.py.
+# One pooled engine per process; pool_pre_ping tests a connection before it is handed
+# out, so a PostgreSQL restart costs one failed ping instead of a dead ingest loop.
+# psycopg2 is named explicitly: run_prepared() and UL.py rely on its cursors.
+DATABASE_URL = config.DATABASE_URL
+
+POOL_SIZE = 5               # connections kept open (full_api: 4 upload workers + requests)
+POOL_MAX_OVERFLOW = 5       # extra connections under bursts, closed again when returned
+POOL_RECYCLE = 1800         # seconds; replace connections older than this on checkout
+POOL_TIMEOUT = 10           # seconds to wait for a free connection
+
+
+def make_engine(url=DATABASE_URL, **kwargs):
+    options = dict(pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_recycle=POOL_RECYCLE,
+                   pool_timeout=POOL_TIMEOUT, pool_pre_ping=True)
+    options.update(kwargs)
+    return create_engine(url, **options)
+
+
+engine = make_engine()
+
+
+# Pooled psycopg2 connection for code that works with cursors directly (UL.py).
+# Call .close() to give it back to the pool, .invalidate() if it is broken.
+def raw_connection():
+    return engine.raw_connection()
+
+
+# Dedicated connection outside the pool (LISTEN in webapi.py holds it forever).
+def direct_connection():
+    return psycopg2.connect(**engine.url.translate_connect_args(username="user", database="dbname"))
+
+
+# === PREPARED STATEMENTS ===
+# Hot queries are parsed and planned once per pooled connection (PREPARE) and then only
+# EXECUTEd. Multi-row inserts take arrays and unnest() them, so one prepared statement
+# covers any batch size.
+STATEMENTS = {
+    "image_ids_by_path": ("text[]", """
+        SELECT imageid, ImagePath FROM Image_Data WHERE ImagePath = ANY($1)
+    """),
+    "images_with_ai_state": ("integer[]", """
+        SELECT i.imageid, i.ImagePath, EXISTS (SELECT 1 FROM ai_results a WHERE a.imageid = i.imageid)
+        FROM Image_Data i
+        WHERE i.imageid = ANY($1)
+    """),
+    "insert_images": ("timestamp, text[], integer, integer, integer", """
+        INSERT INTO Image_Data (ImageTime, ImagePath, Robot_LocationID, RobotID, ObjectID)
+        SELECT $1, p, $3, $4, $5 FROM unnest($2) AS p
+        RETURNING imageid, ImagePath
+    """),
+    "insert_ai_results": ("timestamp[], boolean[], integer[], text", """
+        INSERT INTO ai_results (date, anomalystatus, robot_locationid, imageid, robotid, gps_id, objectid, description)
+        SELECT d, a, 1, i, 1, NULL, NULL, $4 FROM unnest($1, $2, $3) AS u(d, a, i)
+    """),
+    "insert_logs": ("timestamp[], text[], integer, text", """
+        INSERT INTO Logs (LogTime, Action, UserID, LogFilePath)
+        SELECT t, a, $3, $4 FROM unnest($1, $2) AS u(t, a)
+    """),
+}
+
+
+# Runs a prepared statement on a pooled DBAPI connection (raw_connection() or
+# Connection.connection of an engine connection) and returns its rows.
+# Which statements exist is remembered in the pool's per-connection info dict,
+# which is cleared when the connection is invalidated and replaced.
+def run_prepared(dbapi_conn, name, *params):
+    prepared = dbapi_conn.info.setdefault("prepared", set())
+    with dbapi_conn.cursor() as cur:
+        if name not in prepared:
+            types, sql = STATEMENTS[name]
+            cur.execute(f"PREPARE {name} ({types}) AS {sql}")
+            prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+        return cur.fetchall() if cur.description else []
+
+
+# === SCHEMA ===
+# Indexes the hot queries above rely on. Idempotent; run at startup by the writers.
+SCHEMA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS image_data_imagepath_idx ON Image_Data (ImagePath)",
+    "CREATE INDEX IF NOT EXISTS ai_results_imageid_idx ON ai_results (imageid)",
+]
+
+
+def ensure_schema():
+    with engine.begin() as conn:
+        for statement in SCHEMA_INDEXES:
+            conn.execute(text(statement))
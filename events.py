@@ -0,0 +1,122 @@
+import asyncio
+import json
+import select
+import threading
+import time
+from collections import deque
+
+import psycopg2
+
+# PostgreSQL NOTIFY channel shared by the publishers (UL.py, full_api.py)
+# and the live feed in webapi.py. Notifications are only delivered once the
+# publishing transaction commits, so subscribers never see rows that were rolled back.
+EVENT_CHANNEL = "robot_events"
+
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD = 7900
+
+
+def event_payload(event_type, **fields):
+    payload = json.dumps({"type": event_type, **fields}, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({"type": event_type, "truncated": True,
+                              **{k: v for k, v in fields.items() if not isinstance(v, (dict, list, str))}},
+                             default=str)
+    return payload
+
+
+# One subscriber's bounded queue. When a slow client overflows, nothing more is queued for it;
+# the stream then catches up from the shared history instead (or gets a reset event).
+class Subscriber:
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event_id, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((event_id, event))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+# In-process fan-out bus with a replay history for resume-from-cursor.
+# Event ids are "<boot>-<seq>", so a cursor from a previous webapi run is detected as stale.
+class EventBroadcaster:
+    def __init__(self, history=2000, client_queue=256):
+        self.history = deque(maxlen=history)
+        self.client_queue = client_queue
+        self.boot = str(int(time.time()))
+        self.seq = 0
+        self.subscribers = set()
+        self.loop = None
+
+    def attach(self, loop):
+        self.loop = loop
+
+    # Thread-safe entry point (called from the LISTEN thread)
+    def publish(self, event):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event):
+        self.seq += 1
+        event_id = f"{self.boot}-{self.seq}"
+        self.history.append((self.seq, event_id, event))
+        for sub in self.subscribers:
+            sub.offer(event_id, event)
+
+    # Events after `cursor`, or None if the cursor is too old / from another run.
+    def replay(self, cursor):
+        boot, _, seq = (cursor or "").partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if self.history and seq < self.history[0][0] - 1:
+            return None
+        return [(event_id, event) for s, event_id, event in self.history if s > seq]
+
+    @staticmethod
+    def seq_of(event_id):
+        return int(event_id.rsplit("-", 1)[1])
+
+    def subscribe(self):
+        sub = Subscriber(self.client_queue)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+
+# LISTENs on EVENT_CHANNEL and forwards every notification to the broadcaster.
+# Runs in its own thread and reconnects on connection loss.
+def listen_forever(connect, broadcaster):
+    while True:
+        conn = None
+        try:
+            conn = connect()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {EVENT_CHANNEL}")
+            print(f"[EVENTS] Listening on '{EVENT_CHANNEL}'")
+            while True:
+                if select.select([conn], [], [], 15) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        broadcaster.publish(json.loads(notify.payload))
+                    except ValueError:
+                        print(f"[EVENTS] Invalid payload ignored: {notify.payload[:100]}")
+        except Exception as e:
+            print(f"[EVENTS] Listener error: {e} → reconnecting in 5 s")
+            if conn is not None:
+                conn.close()
+            time.sleep(5)
+
+
+def start_listener(connect, broadcaster):
+    threading.Thread(target=listen_forever, args=(connect, broadcaster), daemon=True).start()
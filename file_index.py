@@ -0,0 +1,105 @@
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from filenames import NAME_TIME_RE
+from fswatch import DirWatcher
+
+
+# Names without a timestamp (Pi5_Latest.json, image_info.json) are overwritten in place,
+# so they sort as "newest" and come first in a newest-first listing.
+def time_key(name):
+    m = NAME_TIME_RE.search(name)
+    if m is None:
+        return "~"
+    return f"{m.group(1)}_{m.group(2)}_{m.group(3) or '000'}"
+
+
+def datetime_key(dt):
+    return dt.strftime("%Y%m%d_%H%M%S_") + f"{dt.microsecond // 1000:03d}"
+
+
+def sort_key(name):
+    return (time_key(name), name)
+
+
+# Ordered, in-memory index of the files in one folder, kept fresh by inotify.
+# Names are kept sorted by the timestamp in the filename, so a page costs
+# O(log N + page size) instead of a listdir + sort of the whole folder.
+class FileIndex:
+    def __init__(self, folder, suffix):
+        self.folder = folder
+        self.suffix = suffix
+        self.names = []
+        self.lock = threading.Lock()
+
+    def _wanted(self, name):
+        return name.lower().endswith(self.suffix)
+
+    def rebuild(self):
+        with os.scandir(self.folder) as it:
+            names = sorted((e.name for e in it if e.is_file() and self._wanted(e.name)), key=sort_key)
+        with self.lock:
+            self.names = names
+
+    def add(self, name):
+        with self.lock:
+            i = bisect_left(self.names, sort_key(name), key=sort_key)
+            if i == len(self.names) or self.names[i] != name:
+                insort(self.names, name, key=sort_key)
+
+    def remove(self, name):
+        with self.lock:
+            i = bisect_left(self.names, sort_key(name), key=sort_key)
+            if i < len(self.names) and self.names[i] == name:
+                del self.names[i]
+
+    def start(self):
+        self.rebuild()
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+        print(f"[INDEX] {self.folder}: {len(self.names)} files indexed")
+
+    def _watch_loop(self):
+        watcher = DirWatcher([self.folder], removals=True)
+        # Files that arrived between the first scan and the watch being set up
+        self.rebuild()
+        while True:
+            try:
+                events = watcher.read_events(1)
+                if events is None:
+                    self.rebuild()
+                    continue
+                for _, name, removed in events:
+                    if not self._wanted(name):
+                        continue
+                    if removed:
+                        self.remove(name)
+                    else:
+                        self.add(name)
+            except Exception as e:
+                print(f"[INDEX] Watch error on {self.folder}: {e}")
+
+    # Newest-first page. `cursor` is the last filename of the previous page;
+    # `since` / `until` are datetimes matched against the timestamp in the filename.
+    # Returns (names, next_cursor); next_cursor is None on the last page.
+    def page(self, limit, cursor=None, since=None, until=None):
+        with self.lock:
+            lo = 0
+            hi = len(self.names)
+            if since is not None:
+                lo = bisect_left(self.names, (datetime_key(since), ""), key=sort_key)
+            if until is not None:
+                hi = bisect_right(self.names, (datetime_key(until), "\uffff"), key=sort_key)
+            if cursor:
+                hi = min(hi, bisect_left(self.names, sort_key(cursor), key=sort_key))
+            start = max(lo, hi - limit)
+            names = self.names[start:hi][::-1]
+        next_cursor = names[-1] if names and start > lo else None
+        return names, next_cursor
+
+
+def parse_time(value):
+    if value is None:
+        return None
+    return datetime.fromisoformat(value)
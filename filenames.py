@@ -0,0 +1,6 @@
+import re
+
+# Capture time in the names both Pis write, shared by file_index.py (Pi4) and metrics.py
+# (both Pis) without either side importing the other's modules.
+# photo_20250101_120000_123.jpg / Arduino_20250101_120000.json → "20250101_120000_123" / "20250101_120000_000"
+NAME_TIME_RE = re.compile(r"(\d{8})_(\d{6})(?:_(\d{3}))?")
@@ -0,0 +1,75 @@
+import os
+import time
+
+# inotify is Linux-only; on other machines we degrade to the old listdir poll.
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+    flags = None
+
+
+# Watches a set of directories for *completed* files.
+# Only IN_CLOSE_WRITE (writer closed the file, e.g. scp finished) and
+# IN_MOVED_TO (atomic rename into the folder) are used, so files that are
+# still being copied never show up as arrivals.
+# With removals=True, deletes and renames out of the folder are reported as well
+# (see read_events), which is what an index of the folder contents needs.
+class DirWatcher:
+    def __init__(self, dirs, removals=False):
+        self.dirs = list(dirs)
+        self.inotify = None
+        self.wd_to_dir = {}
+
+        if INotify is not None:
+            self.inotify = INotify()
+            mask = flags.CLOSE_WRITE | flags.MOVED_TO
+            if removals:
+                mask |= flags.DELETE | flags.MOVED_FROM
+            for d in self.dirs:
+                wd = self.inotify.add_watch(d, mask)
+                self.wd_to_dir[wd] = d
+
+    @property
+    def event_driven(self):
+        return self.inotify is not None
+
+    # Full listing of every watched folder (startup catch-up / overflow recovery)
+    def scan(self):
+        arrivals = []
+        for d in self.dirs:
+            with os.scandir(d) as it:
+                names = sorted(e.name for e in it if e.is_file())
+            arrivals.extend((d, name) for name in names)
+        return arrivals
+
+    # Wait up to `timeout` seconds and return (dir, filename, removed) events.
+    # Returns None when the caller has to rescan (polling mode or inotify queue overflow).
+    def read_events(self, timeout):
+        if self.inotify is None:
+            time.sleep(timeout)
+            return None
+
+        events = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                print("[WATCH] inotify queue overflow → rescanning folders")
+                return None
+            if event.mask & flags.ISDIR or not event.name:
+                continue
+            d = self.wd_to_dir.get(event.wd)
+            if d is not None:
+                removed = bool(event.mask & (flags.DELETE | flags.MOVED_FROM))
+                events.append((d, event.name, removed))
+        return events
+
+    # Wait up to `timeout` seconds and return the new (dir, filename) arrivals.
+    def read(self, timeout):
+        events = self.read_events(timeout)
+        if events is None:
+            return self.scan()
+        return [(d, name) for d, name, removed in events if not removed]
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
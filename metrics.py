@@ -0,0 +1,104 @@
+import time
+from datetime import datetime
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, make_asgi_app, start_http_server
+from prometheus_client.core import CounterMetricFamily
+
+from filenames import NAME_TIME_RE
+
+# Prometheus instrumentation shared by the Pi5 sender, UL.py, full_api.py and webapi.py.
+# Every process exposes its own metrics: /metrics on the FastAPI apps (instrument_app),
+# an exporter thread (serve) on the Pi5 and in UL.py.
+
+# Seconds; covers a fast local write up to a frame stuck behind a long outage
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+# ==== SCRAPE-TIME VALUES ====
+# Queue depths and counters a module already keeps (files sent, frames dropped, ...)
+# are read when Prometheus scrapes instead of being mirrored on every change.
+# A value that cannot be read right now (DB down, not started yet) is reported as NaN
+# by a gauge and left out of the scrape by a counter.
+def gauge_from(name, documentation, func):
+    def read():
+        try:
+            return func()
+        except Exception:
+            return float("nan")
+
+    gauge = Gauge(name, documentation)
+    gauge.set_function(read)
+    return gauge
+
+
+class ScrapeCounter:
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        REGISTRY.register(self)
+
+    def describe(self):
+        yield CounterMetricFamily(self.name, self.documentation)
+
+    def collect(self):
+        try:
+            value = self.func()
+        except Exception:
+            return
+        yield CounterMetricFamily(self.name, self.documentation, value=value)
+
+
+def counter_from(name, documentation, func):
+    return ScrapeCounter(name, documentation, func)
+
+
+# ==== FRAME STAGES ====
+# A frame carries its capture time in its name (photo_YYYYmmdd_HHMMSS_fff.jpg) from the
+# Pi5 camera to ai_results, so every stage can report "seconds since capture" without
+# an extra side channel. Pi5 and Pi4 clocks must be NTP-synced for cross-host stages.
+frame_stage_seconds = Histogram(
+    "frame_stage_seconds", "Seconds from capture until a frame reached the stage", ("stage",),
+    buckets=LATENCY_BUCKETS)
+
+
+def capture_time(filename):
+    m = NAME_TIME_RE.search(filename)
+    if m is None:
+        return None
+    return datetime.strptime(f"{m.group(1)}{m.group(2)}{m.group(3) or '000'}", "%Y%m%d%H%M%S%f")
+
+
+def observe_stage(stage, filename, at=None):
+    captured = capture_time(filename)
+    if captured is not None:
+        at = at or datetime.now()
+        frame_stage_seconds.labels(stage=stage).observe(max(0.0, (at - captured).total_seconds()))
+
+
+# ==== FASTAPI ====
+# /metrics (prometheus_client's ASGI app, mounted; /metrics redirects to /metrics/) plus
+# per-route request latency for full_api.py / webapi.py.
+# For streamed responses (/events, /history) the time is until the headers are sent.
+request_seconds = Histogram("http_request_seconds", "HTTP request latency", ("route", "method", "status"),
+                            buckets=LATENCY_BUCKETS)
+
+
+def instrument_app(app):
+    @app.middleware("http")
+    async def time_requests(request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_seconds.labels(route=route, method=request.method,
+                               status=response.status_code).observe(time.perf_counter() - started)
+        return response
+
+    app.mount("/metrics", make_asgi_app())
+
+
+# ==== EXPORTER ====
+# Stand-alone /metrics endpoint for processes without a web server (send_database.py, UL.py).
+def serve(port, host="0.0.0.0"):
+    start_http_server(port, addr=host)
+    print(f"[METRICS] Exporter on http://{host}:{port}/metrics")
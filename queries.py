@@ -0,0 +1,254 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import text
+
+import db
+
+# History queries for webapi.py over the tables UL.py / full_api.py fill.
+# Every series has a time column and a row_id tie-breaker, indexed together, so
+# time-range scans are index range scans and the next page starts right after the
+# cursor (last time + row_id) instead of skipping rows with a growing OFFSET.
+SERIES = {
+    "arduino": {
+        "table": "arduino_logs",
+        "time": "timestamp",
+        "columns": ["gyrox", "gyroy", "gyroz", "neckservo", "headservo",
+                    "frontdistance", "leftdistance", "rightdistance", "motorstate"],
+        "numeric": ["gyrox", "gyroy", "gyroz", "neckservo", "headservo",
+                    "frontdistance", "leftdistance", "rightdistance"],
+        "counts": {},
+        "rollups": True,
+    },
+    "pi5": {
+        "table": "pi5_stats",
+        "time": "timestamp",
+        "columns": ["cpu", "ram", "cpu_temp", "gpu_temp", "upload_speed", "download_speed"],
+        "numeric": ["cpu", "ram", "cpu_temp", "gpu_temp", "upload_speed", "download_speed"],
+        "counts": {},
+        "rollups": True,
+    },
+    "ai": {
+        "table": "ai_results",
+        "time": "date",
+        "columns": ["imageid", "anomalystatus", "objectid", "robotid", "description"],
+        "numeric": [],
+        "counts": {"anomalies": "count(*) FILTER (WHERE anomalystatus)"},
+        "rollups": False,
+    },
+}
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+MAX_BUCKETS = 10000         # refuse aggregations that would return more rows than this
+TARGET_POINTS = 1500        # without ?bucket=, the finest bucket giving at most this many points
+
+# Rollup tables maintained by UL.py (rollups.py), finest first: <table>_1m, <table>_1h
+RESOLUTIONS = {"1m": "minute", "1h": "hour"}
+
+# Retention of the rollup series, enforced by rollups.maintain(): raw rows and minute
+# buckets older than this are deleted (None keeps forever). Queries use it to read from
+# the finest resolution that still holds the requested range.
+RETENTION = {
+    "raw": timedelta(days=7),
+    "1m": timedelta(days=90),
+    "1h": None,
+}
+STREAM_CHUNK = 1000         # rows fetched from the server-side cursor / per columnar block
+
+FORMATS = ("ndjson", "columnar")
+
+
+# row_id gives append-only tables a unique, monotonic key for keyset pagination.
+# Adding it numbers existing rows once (table rewrite under an ACCESS EXCLUSIVE lock), so
+# only the writer runs this, at UL.py startup (rollups.ensure_rollup_schema), and the
+# ALTER is skipped once the column exists so later restarts take no table lock.
+def schema_statements(conn):
+    statements = []
+    for spec in SERIES.values():
+        table, time_col = spec["table"], spec["time"]
+        has_row_id = conn.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = :table AND column_name = 'row_id'
+        """), {"table": table}).first()
+        if has_row_id is None:
+            statements.append(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_id BIGSERIAL")
+        if conn.execute(text("SELECT to_regclass(:index)"), {"index": f"{table}_time_row_idx"}).scalar() is None:
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_time_row_idx ON {table} ({time_col}, row_id)")
+    return statements
+
+
+def ensure_query_schema():
+    with db.engine.begin() as conn:
+        for statement in schema_statements(conn):
+            conn.execute(text(statement))
+
+
+# Cursor format: "<ISO time>|<row_id>" of the last row of the previous page
+def parse_cursor(cursor):
+    if cursor is None:
+        return None
+    time_str, _, row_id = cursor.rpartition("|")
+    return datetime.fromisoformat(time_str), int(row_id)
+
+
+def format_cursor(time_value, row_id):
+    return f"{time_value.isoformat()}|{row_id}"
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def range_filter(spec, since, until, cursor=None, descending=False):
+    time_col = spec["time"]
+    clauses, params = [], {}
+    if since is not None:
+        clauses.append(f"{time_col} >= :since")
+        params["since"] = since
+    if until is not None:
+        clauses.append(f"{time_col} < :until")
+        params["until"] = until
+    if cursor is not None:
+        clauses.append(f"({time_col}, row_id) {'<' if descending else '>'} (:cursor_time, :cursor_id)")
+        params["cursor_time"], params["cursor_id"] = cursor
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+# Start of the data a source still holds for a series (None: everything is kept)
+def retained_since(spec, source, now=None):
+    keep = RETENTION.get(source) if spec["rollups"] else None
+    if keep is None:
+        return None
+    return (now or datetime.now()) - keep
+
+
+# Raw rows of a series, one keyset page. Returns (next_cursor, chunks): the next cursor
+# is looked up first (index-only) so it can go into the response headers, and chunks
+# streams the rows like stream(). Both run in one REPEATABLE READ transaction on one
+# connection, so the cursor always is the last row of the streamed page even while
+# UL.py keeps inserting. Raw rows of arduino/pi5 only go back RETENTION["raw"]; older
+# ranges are answered by the aggregate route.
+def rows_query(name, limit, cursor=None, since=None, until=None, descending=False, fmt="ndjson"):
+    spec = SERIES[name]
+    time_col = spec["time"]
+    where, params = range_filter(spec, since, until, parse_cursor(cursor), descending)
+    direction = "DESC" if descending else "ASC"
+    order = f" ORDER BY {time_col} {direction}, row_id {direction}"
+    boundary_sql = f"SELECT {time_col}, row_id FROM {spec['table']}{where}{order} OFFSET :last LIMIT 2"
+    columns = ", ".join([f"{time_col} AS time", "row_id"] + spec["columns"])
+    sql = f"SELECT {columns} FROM {spec['table']}{where}{order} LIMIT :limit"
+
+    # The generator yields the cursor first; priming it here also means closing it
+    # (finished or client gone) always ends the transaction
+    chunks = page_chunks(boundary_sql, sql, params, limit, fmt)
+    return next(chunks), chunks
+
+
+def page_chunks(boundary_sql, sql, params, limit, fmt):
+    with db.engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn, conn.begin():
+        boundary = conn.execute(text(boundary_sql), dict(params, last=limit - 1)).fetchall()
+        yield format_cursor(*boundary[0]) if len(boundary) == 2 else None
+        result = conn.execution_options(stream_results=True).execute(text(sql), dict(params, limit=limit))
+        yield from encode(result, fmt)
+
+
+def rollup_table(spec, resolution):
+    return f"{spec['table']}_{resolution}"
+
+
+def choose_bucket(since, until):
+    span = (until - since).total_seconds()
+    for bucket, seconds in BUCKETS.items():
+        if span / seconds <= TARGET_POINTS:
+            return bucket
+    return "day"
+
+
+# Picks the table an aggregation reads and returns (source, bucket); source None reads
+# the raw table. Only rollups whose retention still covers `since` are considered; of
+# those, the coarsest one that divides the bucket is used. When none divides it (minute
+# buckets older than the minute retention), the bucket is widened to the finest
+# rollup that still has the data, instead of returning an empty pruned range.
+def source_for(spec, bucket, since, now=None):
+    if not spec["rollups"]:
+        return None, bucket
+    kept = [(resolution, unit) for resolution, unit in RESOLUTIONS.items()
+            if retained_since(spec, resolution, now) is None or since >= retained_since(spec, resolution, now)]
+    if not kept:
+        kept = list(RESOLUTIONS.items())[-1:]
+    fitting = [resolution for resolution, unit in kept if BUCKETS[unit] <= BUCKETS[bucket]]
+    if fitting:
+        return fitting[-1], bucket
+    resolution, unit = kept[0]
+    return resolution, unit
+
+
+# Server-side aggregation per time bucket: sample count, min/avg/max of each requested
+# numeric field and the series' counters (e.g. anomalies per hour for "ai").
+# Buckets are answered from the coarsest rollup table that fits, so a week of data is
+# ~10k hourly rows instead of millions of raw samples (and survives raw retention).
+# Returns (sql, params, bucket, source) with source "raw", "1m" or "1h"; the bucket can
+# be wider than requested when the finer data has been pruned (see source_for).
+def aggregate_query(name, bucket, since, until, fields=None):
+    spec = SERIES[name]
+    if since is not None and until is not None and bucket is None:
+        bucket = choose_bucket(since, until)
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    if since is None or until is None or until <= since:
+        raise ValueError("aggregations need since < until")
+    if (until - since).total_seconds() / BUCKETS[bucket] > MAX_BUCKETS:
+        raise ValueError(f"range too large for {bucket} buckets (max {MAX_BUCKETS})")
+    fields = spec["numeric"] if fields is None else fields
+    unknown = [f for f in fields if f not in spec["numeric"]]
+    if unknown:
+        raise ValueError(f"unknown field(s) {', '.join(unknown)}; use {', '.join(spec['numeric'])}")
+
+    source, bucket = source_for(spec, bucket, since)
+    if source is None:
+        selects = [f"date_trunc('{bucket}', {spec['time']}) AS time", "count(*) AS samples"]
+        for field in fields:
+            selects += [f"min({field})::float8 AS {field}_min",
+                        f"avg({field})::float8 AS {field}_avg",
+                        f"max({field})::float8 AS {field}_max"]
+        selects += [f"{expr} AS {alias}" for alias, expr in spec["counts"].items()]
+        where, params = range_filter(spec, since, until)
+        sql = f"SELECT {', '.join(selects)} FROM {spec['table']}{where} GROUP BY 1 ORDER BY 1"
+        return sql, params, bucket, "raw"
+
+    selects = [f"date_trunc('{bucket}', bucket) AS time", "sum(samples)::bigint AS samples"]
+    for field in fields:
+        selects += [f"min({field}_min) AS {field}_min",
+                    f"(sum({field}_sum) / nullif(sum({field}_count), 0))::float8 AS {field}_avg",
+                    f"max({field}_max) AS {field}_max"]
+    # The bucket holding `since` starts before it but still belongs to the range
+    sql = (f"SELECT {', '.join(selects)} FROM {rollup_table(spec, source)}"
+           f" WHERE bucket >= date_trunc('{RESOLUTIONS[source]}', CAST(:since AS timestamp))"
+           f" AND bucket < :until GROUP BY 1 ORDER BY 1")
+    return sql, {"since": since, "until": until}, bucket, source
+
+
+# Streams a query as NDJSON: one object per row, or with "columnar" one
+# {"column": [values...]} block per STREAM_CHUNK rows. Rows come from a server-side
+# cursor, so memory stays flat however large the range is.
+def stream(sql, params, fmt="ndjson"):
+    with db.engine.connect() as conn:
+        yield from encode(conn.execution_options(stream_results=True).execute(text(sql), params), fmt)
+
+
+def encode(result, fmt):
+    keys = list(result.keys())
+    while True:
+        rows = result.fetchmany(STREAM_CHUNK)
+        if not rows:
+            break
+        if fmt == "columnar":
+            block = {key: [row[i] for row in rows] for i, key in enumerate(keys)}
+            yield json.dumps(block, default=json_default) + "\n"
+        else:
+            yield "".join(json.dumps(dict(zip(keys, row)), default=json_default) + "\n" for row in rows)
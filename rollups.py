@@ -0,0 +1,153 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+import db
+from queries import RESOLUTIONS, RETENTION, SERIES, ensure_query_schema, rollup_table
+
+# 1-minute and 1-hour aggregates of arduino_logs / pi5_stats, kept up to date by UL.py.
+# Each rollup row stores min, max, sum and count per field, so new samples are merged
+# into an existing bucket exactly (avg = sum / count) without rereading old rows.
+# Progress is a row_id watermark per table in rollup_state: UL.py is the only writer of
+# these tables and rolls up inside its ingest transaction, so row_ids never commit
+# behind the watermark.
+ROLLUP_SERIES = [name for name, spec in SERIES.items() if spec["rollups"]]
+
+# At most this many raw rows are folded in per call, so the first run over an existing
+# table (or a big backlog) is spread over several short transactions.
+ROLLUP_MAX_ROWS = 50000
+
+# Retention is defined next to the queries that route around it (queries.RETENTION).
+# Raw rows are only deleted once they are part of the rollups.
+PRUNE_INTERVAL = 60         # seconds between maintenance passes in UL.py
+PRUNE_BATCH = 5000          # rows per DELETE (one short transaction each)
+PRUNE_MAX_BATCHES = 20      # per table and pass, so ingest is never held up for long
+
+
+def schema_statements():
+    statements = ["""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            source TEXT PRIMARY KEY,
+            last_row_id BIGINT NOT NULL DEFAULT 0
+        )
+    """]
+    for name in ROLLUP_SERIES:
+        spec = SERIES[name]
+        statements.append(f"CREATE INDEX IF NOT EXISTS {spec['table']}_row_id_idx ON {spec['table']} (row_id)")
+        field_columns = "".join(
+            f", {f}_min DOUBLE PRECISION, {f}_max DOUBLE PRECISION, {f}_sum DOUBLE PRECISION, "
+            f"{f}_count BIGINT NOT NULL DEFAULT 0"
+            for f in spec["numeric"])
+        for resolution in RESOLUTIONS:
+            statements.append(f"""
+                CREATE TABLE IF NOT EXISTS {rollup_table(spec, resolution)} (
+                    bucket TIMESTAMP PRIMARY KEY,
+                    samples BIGINT NOT NULL{field_columns}
+                )
+            """)
+        statements.append(f"""
+            INSERT INTO rollup_state (source) VALUES ('{spec['table']}') ON CONFLICT DO NOTHING
+        """)
+    return statements
+
+
+# Rollups build on the row_id column added for keyset pagination (queries.py).
+def ensure_rollup_schema():
+    ensure_query_schema()
+    with db.engine.begin() as conn:
+        for statement in schema_statements():
+            conn.execute(text(statement))
+
+
+def upsert_sql(spec, resolution):
+    target = rollup_table(spec, resolution)
+    fields = spec["numeric"]
+    columns = ", ".join(["bucket", "samples"] + [f"{f}_{agg}" for f in fields for agg in ("min", "max", "sum", "count")])
+    selects = ", ".join([f"date_trunc('{RESOLUTIONS[resolution]}', {spec['time']})", "count(*)"]
+                        + [f"{agg}({f})" for f in fields for agg in ("min", "max", "sum", "count")])
+    updates = ", ".join([f"samples = {target}.samples + EXCLUDED.samples"] + [
+        part for f in fields for part in (
+            f"{f}_min = LEAST({target}.{f}_min, EXCLUDED.{f}_min)",
+            f"{f}_max = GREATEST({target}.{f}_max, EXCLUDED.{f}_max)",
+            f"{f}_sum = coalesce({target}.{f}_sum, 0) + coalesce(EXCLUDED.{f}_sum, 0)",
+            f"{f}_count = {target}.{f}_count + EXCLUDED.{f}_count",
+        )])
+    return f"""
+        INSERT INTO {target} ({columns})
+        SELECT {selects} FROM {spec['table']}
+        WHERE row_id > %(low)s AND row_id <= %(high)s AND {spec['time']} IS NOT NULL
+        GROUP BY 1
+        ON CONFLICT (bucket) DO UPDATE SET {updates}
+    """
+
+
+# Folds raw rows past the watermark into every rollup table, on the caller's (UL.py)
+# psycopg2 cursor and inside its transaction. Returns the number of raw rows covered.
+def update_rollups(cur):
+    covered = 0
+    for name in ROLLUP_SERIES:
+        spec = SERIES[name]
+        cur.execute("SELECT last_row_id FROM rollup_state WHERE source = %s FOR UPDATE", (spec["table"],))
+        low = cur.fetchone()[0]
+        cur.execute(f"SELECT max(row_id) FROM {spec['table']}")
+        high = min(cur.fetchone()[0] or 0, low + ROLLUP_MAX_ROWS)
+        if high <= low:
+            continue
+        for resolution in RESOLUTIONS:
+            cur.execute(upsert_sql(spec, resolution), {"low": low, "high": high})
+        cur.execute("UPDATE rollup_state SET last_row_id = %s WHERE source = %s", (high, spec["table"]))
+        covered += high - low
+    return covered
+
+
+def prune_batches(conn, sql, params):
+    deleted = 0
+    for _ in range(PRUNE_MAX_BATCHES):
+        with conn.cursor() as cur:
+            cur.execute(sql, dict(params, batch=PRUNE_BATCH))
+            count = cur.rowcount
+        conn.commit()
+        deleted += count
+        if count < PRUNE_BATCH:
+            break
+    return deleted
+
+
+# Periodic maintenance from UL.py's loop: catches the rollups up (backlog, first run)
+# and deletes expired raw rows / minute buckets in bounded batches, each committed
+# on its own so the ingest transaction never waits behind a large DELETE.
+def maintain(conn):
+    with conn.cursor() as cur:
+        for _ in range(PRUNE_MAX_BATCHES):
+            covered = update_rollups(cur)
+            conn.commit()
+            if covered < ROLLUP_MAX_ROWS:
+                break
+
+    now = datetime.now()
+    for name in ROLLUP_SERIES:
+        spec = SERIES[name]
+        table, time_col = spec["table"], spec["time"]
+        if RETENTION["raw"] is not None:
+            deleted = prune_batches(conn, f"""
+                DELETE FROM {table} WHERE row_id IN (
+                    SELECT row_id FROM {table}
+                    WHERE {time_col} < %(cutoff)s
+                      AND row_id <= (SELECT last_row_id FROM rollup_state WHERE source = %(table)s)
+                    LIMIT %(batch)s
+                )
+            """, {"cutoff": now - RETENTION["raw"], "table": table})
+            if deleted:
+                print(f"[ROLLUP] {deleted} raw rows older than {RETENTION['raw'].days} days pruned from {table}")
+        for resolution in RESOLUTIONS:
+            keep = RETENTION.get(resolution)
+            if keep is None:
+                continue
+            target = rollup_table(spec, resolution)
+            deleted = prune_batches(conn, f"""
+                DELETE FROM {target} WHERE bucket IN (
+                    SELECT bucket FROM {target} WHERE bucket < %(cutoff)s LIMIT %(batch)s
+                )
+            """, {"cutoff": now - keep})
+            if deleted:
+                print(f"[ROLLUP] {deleted} buckets older than {keep.days} days pruned from {target}")
@@ -0,0 +1,114 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File suffix per compression mode; UL.py recognises all three
+SEGMENT_SUFFIXES = {None: ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+def open_segment(path, mode, compression):
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if compression == "zstd":
+        if mode == "w":
+            return zstandard.open(path, "wt", encoding="utf-8")
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def compression_of(filename):
+    if filename.endswith(".gz"):
+        return "gzip"
+    if filename.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+# Yields the samples of a segment. A segment cut short by a crash still yields
+# every complete line before the damaged tail.
+def read_segment(path):
+    with open_segment(path, "r", compression_of(path)) as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        return
+        except (EOFError, OSError):
+            return
+
+
+# Appends samples as NDJSON to time-rotated segment files.
+# A segment is written in `open_dir` and moved to `ready_dir` once it holds max_samples
+# samples or is max_age seconds old; `on_ready(path)` is then called to ship it.
+class SegmentWriter:
+    def __init__(self, open_dir, ready_dir, prefix, on_ready,
+                 max_samples=600, max_age=60, compression="gzip"):
+        if compression == "zstd" and zstandard is None:
+            print("[SEGMENT] zstandard is not installed → using gzip")
+            compression = "gzip"
+        self.open_dir = open_dir
+        self.ready_dir = ready_dir
+        self.prefix = prefix
+        self.on_ready = on_ready
+        self.max_samples = max_samples
+        self.max_age = max_age
+        self.compression = compression
+
+        self.file = None
+        self.name = None
+        self.count = 0
+        self.opened_at = 0
+        self.seq = 0    # keeps names unique when several segments close within one millisecond
+
+        os.makedirs(open_dir, exist_ok=True)
+        os.makedirs(ready_dir, exist_ok=True)
+        self._recover()
+
+    # Segments left open by a crash are shipped as they are
+    def _recover(self):
+        for name in sorted(os.listdir(self.open_dir)):
+            if name.startswith(self.prefix + "_"):
+                ready = os.path.join(self.ready_dir, name)
+                os.replace(os.path.join(self.open_dir, name), ready)
+                print(f"[SEGMENT] Recovered unfinished segment → {name}")
+                self.on_ready(ready)
+
+    def _open(self):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        self.seq = (self.seq + 1) % 1000
+        self.name = f"{self.prefix}_{stamp}_{self.seq:03d}{SEGMENT_SUFFIXES[self.compression]}"
+        self.file = open_segment(os.path.join(self.open_dir, self.name), "w", self.compression)
+        self.count = 0
+        self.opened_at = time.monotonic()
+
+    def append(self, sample):
+        if self.file is None:
+            self._open()
+        self.file.write(json.dumps(sample, separators=(",", ":")) + "\n")
+        self.count += 1
+        if self.count >= self.max_samples or time.monotonic() - self.opened_at >= self.max_age:
+            self.rotate()
+
+    def maybe_rotate(self):
+        if self.file is not None and time.monotonic() - self.opened_at >= self.max_age:
+            self.rotate()
+
+    def rotate(self):
+        if self.file is None:
+            return
+        self.file.close()
+        ready = os.path.join(self.ready_dir, self.name)
+        os.replace(os.path.join(self.open_dir, self.name), ready)
+        print(f"[SEGMENT] Closed {self.name} ({self.count} samples)")
+        self.file = None
+        self.on_ready(ready)
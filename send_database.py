@@ -1,21 +1,58 @@
 #!/usr/bin/python3
 
-import serial
 import os
 import time
-import psutil
-import subprocess
 import threading
 import json
-from datetime import datetime
 
-# ==== AYARLAR ====
-ser = serial.Serial("/dev/ttyACM0", 9600, timeout=0.5)
-base_path = "/home/mergen/Desktop/Burak_Ibici"
+from arduino_reader import ArduinoReader, downsample
+from camera import CameraPipeline, make_frame_source
+from change_detect import ChangeDetector
+import config
+import metrics
+from segments import SegmentWriter
+from spool import Spool
+from stats_sampler import StatsSampler
+from transfer import TransferChannel
 
-pi4_user = "mergen"
-pi4_ip = "10.146.42.252"
-pi4_dest_base = "/home/mergen/Desktop/db"
+# ==== AYARLAR ====
+SERIAL_PORT = config.SERIAL_PORT
+SERIAL_BAUD = 9600
+base_path = config.PI5_BASE_DIR
+
+pi4_user = config.PI4_USER
+pi4_ip = config.PI4_HOST
+pi4_dest_base = config.PI4_DEST_BASE
+pi4_port = config.PI4_PORT
+
+# Tek SSH bağlantısı + sınırlı işçi havuzu (dosya başına scp yerine)
+TRANSFER_WORKERS = 2
+TRANSFER_QUEUE_SIZE = 512
+
+# Bekleyen dosyalar: disk kotası, öncelik sırası ve hız sınırlı birikim boşaltma
+SPOOL_QUOTA_BYTES = 2 * 1024 ** 3   # Pending/ may use at most this much disk
+SPOOL_EVICTION = "oldest_images"    # "oldest_images" (telemetry is kept) or "oldest_any"
+FRESH_FRAME_SECONDS = 30            # newer frames jump ahead of telemetry and the backlog
+BACKLOG_RATE = 2.0                  # older frames sent per second after an outage
+DISPATCH_WINDOW = 16                # files handed to the channel at a time
+DISPATCH_INTERVAL = 0.5
+
+spool = Spool(os.path.join(base_path, "Pending", "spool.sqlite3"), SPOOL_QUOTA_BYTES,
+              eviction=SPOOL_EVICTION, fresh_seconds=FRESH_FRAME_SECONDS, backlog_rate=BACKLOG_RATE)
+channel = TransferChannel(pi4_ip, pi4_user, pi4_dest_base, port=pi4_port,
+                          workers=TRANSFER_WORKERS, queue_size=TRANSFER_QUEUE_SIZE,
+                          on_done=lambda path, sent, deleted: transfer_done(path, sent, deleted))
+
+# Arduino örnekleri: örnek başına JSON yerine sıkıştırılmış NDJSON segmentleri
+SEGMENT_MAX_SAMPLES = 600     # ship when a segment holds this many samples...
+SEGMENT_MAX_AGE = 60          # ...or is this many seconds old
+SEGMENT_COMPRESSION = "gzip"  # "gzip", "zstd" or None
+
+# Seri port sürekli okunur; gönderilecek örnek sayısı buradan azaltılabilir
+ARDUINO_BUFFER_SIZE = 4096        # ring buffer between the reader thread and main_loop
+ARDUINO_DOWNSAMPLE = "all"        # "all", "decimate" or "mean"
+ARDUINO_DOWNSAMPLE_N = 1          # group size for "decimate" / "mean"
+arduino = ArduinoReader(SERIAL_PORT, SERIAL_BAUD, buffer_size=ARDUINO_BUFFER_SIZE)
 
 # ==== KLASÖRLER ====
 def ensure_dirs():
@@ -28,6 +65,9 @@ def get_pending_image_path(filename):
 def get_pending_log_path(filename):
     return os.path.join(base_path, "Pending", "Logs", filename)
 
+def get_open_segment_dir():
+    return os.path.join(base_path, "Pending", "Segments")
+
 # ==== JSON ====
 def write_json(data, path, mode="w"):
     with open(path, mode) as f:
@@ -36,149 +76,139 @@ def write_json(data, path, mode="w"):
         else:
             json.dump(data, f, indent=4)
 
-# ==== SCP GÖNDER ====
+# ==== GÖNDER ====
+# Registers a file with the spool; the dispatch thread hands it to the transfer channel.
 def send_file_to_pi4(local_path, remote_folder):
-    filename = os.path.basename(local_path)
-    remote_path = f"{pi4_user}@{pi4_ip}:{pi4_dest_base}/{remote_folder}/{filename}"
-
-    try:
-        result = subprocess.run(
-            ["scp", local_path, remote_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10
-        )
-        if result.returncode == 0:
-            os.remove(local_path)
-            print(f"[✓] Sent and deleted → {remote_folder}/{filename}")
-        else:
-            print(f"[!] Failed to send: {filename}\n{result.stderr.decode().strip()}")
-    except Exception as e:
-        print(f"[!] Exception during send: {e}")
+    spool.add(local_path, remote_folder)
 
-# ==== SİSTEM VERİLERİ ====
-def get_cpu_temp():
-    try:
-        with open("/sys/class/thermal/thermal_zone0/temp") as f:
-            return f"{int(f.read()) / 1000.0:.1f}°C"
-    except:
-        return "N/A"
-
-def get_gpu_temp():
-    try:
-        out = subprocess.check_output(["vcgencmd", "measure_temp"]).decode()
-        return out.strip().split('=')[1]
-    except:
-        return "N/A"
-
-def get_network_speeds():
-    net1 = psutil.net_io_counters()
-    time.sleep(1)
-    net2 = psutil.net_io_counters()
-    up = (net2.bytes_sent - net1.bytes_sent) / 1024
-    down = (net2.bytes_recv - net1.bytes_recv) / 1024
-    return {"Upload (KB/s)": f"{up:.2f}", "Download (KB/s)": f"{down:.2f}"}
-
-def get_system_stats():
-    cpu = psutil.cpu_percent(interval=0.1)
-    ram = psutil.virtual_memory().used / (1024 * 1024)
-    net = get_network_speeds()
-    return {
-        "CPU": f"{cpu:.1f}%",
-        "RAM": f"{ram:.1f} MB",
-        "CPU Temp": get_cpu_temp(),
-        "GPU Temp": get_gpu_temp(),
-        **net,
-        "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-
-# ==== ARDUINO ====
-def parse_arduino(line):
-    data = {}
-    parts = line.replace("DATA:", "").split(" | ")
-    for part in parts:
-        if part.startswith("Gyro="):
-            gx, gy, gz = part.split("=")[1].split(",")
-            data["Gyro"] = {"X": gx, "Y": gy, "Z": gz}
-        elif part.startswith("ServoAngles="):
-            n, h = part.split("=")[1].split(",")
-            data["ServoAngles"] = {"Neck": n, "Head": h}
-        elif part.startswith("Distance(cm)="):
-            d = part.split("=")[1].split(" ")
-            data["Distances"] = {kv.split(":")[0]: kv.split(":")[1] for kv in d}
-        elif part.startswith("MotorState="):
-            data["MotorState"] = part.split("=")[1]
-    data["Timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return data
-
-# ==== FOTOĞRAF THREADİ ====
-def photo_loop():
-    while True:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        filename = f"photo_{timestamp}.jpg"
-        path = get_pending_image_path(filename)
-
-        # Fotoğraf çek
-        command = f"libcamera-still -o '{path}' -t 1 --width 1920 --height 1080 --nopreview"
-        subprocess.call(command, shell=True)
-        print(f"[Frame] Captured → {filename}")
+def transfer_done(local_path, sent, deleted):
+    spool.done(local_path, sent, deleted)
+    if sent and local_path.endswith(".jpg"):
+        metrics.observe_stage("sent", os.path.basename(local_path))
 
-        # Gönderim için ayrı thread başlat
-        threading.Thread(target=send_file_to_pi4, args=(path, "Images"), daemon=True).start()
+def frame_written(path):
+    metrics.observe_stage("written", os.path.basename(path))
+    send_file_to_pi4(path, "Images")
 
-        time.sleep(1)  # Her 1 saniyede bir
+# ==== SİSTEM VERİLERİ ====
+# Arka planda örneklenir; main_loop asla beklemez
+PI5_STATS_INTERVAL = 5        # seconds between samples / Pi5_Latest.json updates
+GPU_TEMP_EVERY = 6            # run vcgencmd every N samples
+sampler = StatsSampler(interval=PI5_STATS_INTERVAL, gpu_every=GPU_TEMP_EVERY)
+
+# ==== KAMERA ====
+# Kamera açık kalır (fotoğraf başına libcamera-still yerine); kodlama/yazma ayrı thread'de
+CAMERA_BACKEND = config.CAMERA_BACKEND  # "libcamera", "picamera2" or "fake"
+CAMERA_WIDTH = 1920
+CAMERA_HEIGHT = 1080
+CAMERA_FPS = 1.0              # target frames per second written to Pending/Images
+CAMERA_QUEUE_SIZE = 8         # frames waiting for the writer; oldest dropped when full
+JPEG_QUALITY = 90
+
+# Değişim algılama: sabit sahnedeki neredeyse aynı kareler gönderilmez
+CHANGE_DETECTION = True
+CHANGE_THRESHOLD = 1.0        # % of pixels that must differ from the background
+CHANGE_PIXEL_DELTA = 20       # brightness difference (0-255) that counts as changed
+KEYFRAME_INTERVAL = 60        # seconds; always forward one frame this often
+BACKGROUND_ALPHA = 0.05       # how fast the rolling background adapts
+
+def start_camera():
+    source = make_frame_source(CAMERA_BACKEND, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
+    gate = None
+    if CHANGE_DETECTION:
+        # Every decision + score is shipped as ChangeAudit_*.ndjson.gz to the Pi4 Logs folder
+        audit = SegmentWriter(
+            get_open_segment_dir(), os.path.join(base_path, "Pending", "Logs"), "ChangeAudit",
+            on_ready=lambda path: send_file_to_pi4(path, "Logs"),
+            max_samples=SEGMENT_MAX_SAMPLES, max_age=SEGMENT_MAX_AGE, compression=SEGMENT_COMPRESSION,
+        )
+        detector = ChangeDetector(CHANGE_THRESHOLD, CHANGE_PIXEL_DELTA, KEYFRAME_INTERVAL,
+                                  BACKGROUND_ALPHA, audit=audit)
+        gate = lambda captured_at, frame, name: detector.check(captured_at, frame, name)[0]
+    camera = CameraPipeline(
+        source, os.path.join(base_path, "Pending", "Images"), os.path.join(base_path, "Pending", ".capture"),
+        on_frame=frame_written,
+        target_fps=CAMERA_FPS, queue_size=CAMERA_QUEUE_SIZE, jpeg_quality=JPEG_QUALITY, gate=gate,
+    )
+    camera.start()
+    return camera
+
+
+# ==== METRİKLER ====
+# Prometheus exporter: frame stage latencies, queue depths, bytes sent
+METRICS_PORT = config.PI5_METRICS_PORT
+
+def register_metrics(camera):
+    metrics.gauge_from("spool_pending_bytes", "Bytes waiting in Pending/", lambda: spool.total_bytes)
+    metrics.gauge_from("spool_pending_files", "Files waiting in Pending/",
+                       lambda: sum(v["files"] for v in spool.stats().values()))
+    metrics.gauge_from("transfer_in_flight", "Files queued on or being sent by the transfer channel",
+                       channel.pending)
+    metrics.counter_from("transfer_bytes_total", "Bytes sent to the Pi4", lambda: channel.bytes_sent)
+    metrics.counter_from("transfer_files_total", "Files sent to the Pi4", lambda: channel.files_sent)
+    metrics.counter_from("transfer_failures_total", "Failed uploads", lambda: channel.failures)
+    metrics.gauge_from("camera_queue_depth", "Frames waiting for the writer thread", camera.queue.qsize)
+    metrics.counter_from("camera_frames_captured_total", "Frames taken from the camera", lambda: camera.captured)
+    metrics.counter_from("camera_frames_dropped_total", "Frames dropped because the writer was behind",
+                         lambda: camera.dropped)
+    metrics.counter_from("arduino_lines_total", "Serial lines read", lambda: arduino.lines)
+    metrics.counter_from("arduino_samples_dropped_total", "Samples lost to a full ring buffer",
+                         lambda: arduino.dropped)
+    metrics.serve(METRICS_PORT)
 
 
 # ==== DOSYA GÖNDERİM THREADİ ====
-def retry_pending_loop():
+# Pending/ is listed once at startup; afterwards the spool index is the source of truth.
+def dispatch_loop():
+    spool.reconcile([(os.path.join(base_path, "Pending", "Images"), "Images"),
+                     (os.path.join(base_path, "Pending", "Logs"), "Logs")])
     while True:
-        for folder, remote in [("Images", "Images"), ("Logs", "Logs")]:
-            pending_dir = os.path.join(base_path, "Pending", folder)
-            for file in os.listdir(pending_dir):
-                local_path = os.path.join(pending_dir, file)
-                threading.Thread(target=send_file_to_pi4, args=(local_path, remote), daemon=True).start()
+        free = DISPATCH_WINDOW - channel.pending()
+        if free > 0:
+            for local_path, remote in spool.next_batch(free):
+                if not channel.submit(local_path, remote):
+                    spool.done(local_path, sent=False, deleted=False)
 
-        time.sleep(15)
+        time.sleep(DISPATCH_INTERVAL)
 
 # ==== ANA DÖNGÜ ====
 def main_loop():
-    last_arduino = 0
     last_pi5 = 0
+    segment_writer = SegmentWriter(
+        get_open_segment_dir(), os.path.join(base_path, "Pending", "Logs"), "Arduino",
+        on_ready=lambda path: send_file_to_pi4(path, "Logs"),
+        max_samples=SEGMENT_MAX_SAMPLES, max_age=SEGMENT_MAX_AGE, compression=SEGMENT_COMPRESSION,
+    )
 
     while True:
         now = time.time()
 
-        # Arduino
-        if now - last_arduino >= 5:
-            if ser.in_waiting > 0:
-                try:
-                    line = ser.readline().decode("utf-8").strip()
-                    if line.startswith("DATA:"):
-                        parsed = parse_arduino(line)
-                        filename = f"Arduino_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                        path = get_pending_log_path(filename)
-                        write_json(parsed, path, mode="w")
-                        print(f"[Arduino] Logged → {filename}")
-                except:
-                    pass
-            last_arduino = now
+        # Arduino (okuma ayrı thread'de, burada sadece toplanır)
+        for sample in downsample(arduino.drain(), ARDUINO_DOWNSAMPLE, ARDUINO_DOWNSAMPLE_N):
+            segment_writer.append(sample)
+        segment_writer.maybe_rotate()
 
         # Pi5 system
-        if now - last_pi5 >= 5:
-            stats = get_system_stats()
-            filename = "Pi5_Latest.json"
-            path = get_pending_log_path(filename)
-            write_json(stats, path, mode="w")
-            print("[Pi5] Updated system stats.")
+        if now - last_pi5 >= PI5_STATS_INTERVAL:
+            stats = sampler.latest()
+            if stats is not None:
+                filename = "Pi5_Latest.json"
+                path = get_pending_log_path(filename)
+                write_json(stats, path, mode="w")
+                send_file_to_pi4(path, "Logs")
+                print("[Pi5] Updated system stats.")
             last_pi5 = now
 
         time.sleep(0.5)
 
 # ==== BAŞLAT ====
 ensure_dirs()
+channel.start()
+arduino.start()
+sampler.start()
 
-threading.Thread(target=photo_loop, daemon=True).start()
-threading.Thread(target=retry_pending_loop, daemon=True).start()
+register_metrics(start_camera())
+threading.Thread(target=dispatch_loop, daemon=True).start()
 
 try:
     main_loop()
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Upload priority classes, highest first
+PRIORITY_STATS = "stats"          # Pi5_Latest.json – only the newest version matters
+PRIORITY_FRESH = "fresh"          # frames younger than fresh_seconds
+PRIORITY_TELEMETRY = "telemetry"  # Arduino / audit segments
+PRIORITY_BACKLOG = "backlog"      # older frames, drained at a limited rate
+
+
+def kind_of(path):
+    name = os.path.basename(path).lower()
+    if name.endswith(".jpg"):
+        return "image"
+    if name.startswith("pi5_"):
+        return "stats"
+    return "telemetry"
+
+
+# Bounded spool for files waiting to go to the Pi4 (Pending/Images, Pending/Logs).
+# A small SQLite index replaces the periodic directory rescans, enforces a disk quota
+# and hands out files in priority order; old frames are rate-limited so a long outage
+# does not flood the link on recovery.
+class Spool:
+    def __init__(self, index_path, quota_bytes, eviction="oldest_images",
+                 fresh_seconds=30, backlog_rate=2.0):
+        self.quota_bytes = quota_bytes
+        self.eviction = eviction          # "oldest_images" (telemetry is never evicted) or "oldest_any"
+        self.fresh_seconds = fresh_seconds
+        self.backlog_rate = backlog_rate  # files per second
+        self.tokens = backlog_rate
+        self.last_refill = time.monotonic()
+
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        # The spool is built at import time, before send_database.ensure_dirs() runs
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY,
+                remote TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_kind_created ON entries (kind, created)")
+        self.total_bytes = self.db.execute("SELECT coalesce(sum(size), 0) FROM entries").fetchone()[0]
+
+    # One-time reconciliation at startup: forget files that are gone, pick up files that
+    # were written but never indexed (e.g. crash). After this no directory is listed again.
+    def reconcile(self, folders):
+        with self.lock:
+            known = {row[0] for row in self.db.execute("SELECT path FROM entries")}
+        missing = [p for p in known if not os.path.exists(p)]
+        with self.lock:
+            self.db.executemany("DELETE FROM entries WHERE path = ?", [(p,) for p in missing])
+        added = 0
+        for folder, remote in folders:
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if path not in known and os.path.isfile(path):
+                    self.add(path, remote)
+                    added += 1
+        with self.lock:
+            self.total_bytes = self.db.execute("SELECT coalesce(sum(size), 0) FROM entries").fetchone()[0]
+        print(f"[SPOOL] {len(known) - len(missing) + added} files pending "
+              f"({self.total_bytes / 1024 / 1024:.1f} MB), {added} new, {len(missing)} vanished")
+
+    def add(self, path, remote):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            old = self.db.execute("SELECT size FROM entries WHERE path = ?", (path,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                            (path, remote, kind_of(path), st.st_size, st.st_mtime))
+            self.total_bytes += st.st_size - (old[0] if old else 0)
+            self._enforce_quota()
+
+    def _enforce_quota(self):
+        while self.total_bytes > self.quota_bytes:
+            where = "kind = 'image'" if self.eviction == "oldest_images" else "kind != 'stats'"
+            victims = [row for row in self.db.execute(
+                f"SELECT path, size FROM entries WHERE {where} ORDER BY created LIMIT 64")
+                if row[0] not in self.in_flight]
+            if not victims:
+                print(f"[SPOOL] Over quota ({self.total_bytes / 1024 / 1024:.1f} MB) but nothing evictable")
+                return
+            evicted = 0
+            for path, size in victims:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.db.execute("DELETE FROM entries WHERE path = ?", (path,))
+                self.total_bytes -= size
+                evicted += 1
+                if self.total_bytes <= self.quota_bytes:
+                    break
+            print(f"[SPOOL] Quota reached → evicted {evicted} oldest files")
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.backlog_rate * 2, self.tokens + (now - self.last_refill) * self.backlog_rate)
+        self.last_refill = now
+
+    # Next files to upload, at most `limit`, highest priority first; they are marked
+    # in flight until done() is called for them.
+    def next_batch(self, limit):
+        picked = []
+        with self.lock:
+            self._refill()
+            fresh_after = time.time() - self.fresh_seconds
+            skip = len(self.in_flight)
+            queries = [
+                (PRIORITY_STATS, "SELECT path, remote FROM entries WHERE kind = 'stats' ORDER BY created DESC LIMIT ?", ()),
+                (PRIORITY_FRESH, "SELECT path, remote FROM entries WHERE kind = 'image' AND created >= ? "
+                                 "ORDER BY created DESC LIMIT ?", (fresh_after,)),
+                (PRIORITY_TELEMETRY, "SELECT path, remote FROM entries WHERE kind = 'telemetry' "
+                                     "ORDER BY created LIMIT ?", ()),
+                (PRIORITY_BACKLOG, "SELECT path, remote FROM entries WHERE kind = 'image' AND created < ? "
+                                   "ORDER BY created LIMIT ?", (fresh_after,)),
+            ]
+            for priority, sql, args in queries:
+                for path, remote in self.db.execute(sql, (*args, limit + skip)):
+                    if len(picked) >= limit:
+                        break
+                    if path in self.in_flight:
+                        continue
+                    if priority == PRIORITY_BACKLOG:
+                        if self.tokens < 1:
+                            break
+                        self.tokens -= 1
+                    self.in_flight.add(path)
+                    picked.append((path, remote))
+        return picked
+
+    # Upload attempt finished. The entry goes once the local file is gone; a sent file that
+    # was rewritten meanwhile (Pi5_Latest.json) or a failed upload stays queued.
+    def done(self, path, sent, deleted):
+        with self.lock:
+            self.in_flight.discard(path)
+            if deleted:
+                row = self.db.execute("SELECT size FROM entries WHERE path = ?", (path,)).fetchone()
+                if row:
+                    self.db.execute("DELETE FROM entries WHERE path = ?", (path,))
+                    self.total_bytes -= row[0]
+
+    def stats(self):
+        with self.lock:
+            rows = self.db.execute("SELECT kind, count(*), sum(size) FROM entries GROUP BY kind").fetchall()
+        return {kind: {"files": n, "bytes": size} for kind, n, size in rows}
@@ -0,0 +1,91 @@
+import glob
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+CPU_THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def read_sysfs_temp(path=CPU_THERMAL_ZONE):
+    try:
+        with open(path) as f:
+            return int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def read_gpu_temp():
+    try:
+        out = subprocess.check_output(["vcgencmd", "measure_temp"], timeout=2).decode()
+        # temp=48.3'C
+        return float(out.strip().split("=")[1].rstrip("'C"))
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return None
+
+
+# Samples Pi5 system stats in the background without ever sleeping inside a measurement.
+# CPU % and network rates are deltas between two ticks; temperatures come straight from
+# sysfs, and vcgencmd (a fork) only runs every `gpu_every` ticks.
+# Values are plain numbers (None when unavailable), e.g. {"CPU": 12.3, "RAM": 512.0, ...}.
+class StatsSampler:
+    def __init__(self, interval=5, gpu_every=6):
+        self.interval = interval
+        self.gpu_every = gpu_every
+        self.lock = threading.Lock()
+        self.stats = None
+
+        self.ticks = 0
+        self.gpu_temp = None
+        self.last_net = None
+        self.last_time = None
+        self.zones = sorted(glob.glob("/sys/class/thermal/thermal_zone*/temp"))
+
+    def start(self):
+        psutil.cpu_percent(interval=None)   # primes the CPU counter
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[Pi5] Stats sampling error: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def tick(self):
+        now = time.monotonic()
+        net = psutil.net_io_counters()
+        up = down = None
+        if self.last_net is not None:
+            dt = now - self.last_time
+            up = round((net.bytes_sent - self.last_net.bytes_sent) / 1024 / dt, 2)
+            down = round((net.bytes_recv - self.last_net.bytes_recv) / 1024 / dt, 2)
+        self.last_net, self.last_time = net, now
+
+        if self.ticks % self.gpu_every == 0:
+            self.gpu_temp = read_gpu_temp()
+        self.ticks += 1
+
+        cpu_temp = read_sysfs_temp()
+        stats = {
+            "CPU": psutil.cpu_percent(interval=None),
+            "RAM": round(psutil.virtual_memory().used / (1024 * 1024), 1),
+            "CPU Temp": cpu_temp,
+            "GPU Temp": self.gpu_temp,
+            "Upload (KB/s)": up,
+            "Download (KB/s)": down,
+            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if len(self.zones) > 1:
+            stats["Thermal Zones"] = [read_sysfs_temp(z) for z in self.zones]
+        with self.lock:
+            self.stats = stats
+
+    # Latest sample (None until the first tick has run)
+    def latest(self):
+        with self.lock:
+            return dict(self.stats) if self.stats is not None else None
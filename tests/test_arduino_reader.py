@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tty
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from arduino_reader import ArduinoReader
+
+GOOD = b"DATA:Gyro=0.12,-0.40,9.81 | ServoAngles=90,45 | Distance(cm)=Front:120 Left:35 Right:48 | MotorState=FORWARD\n"
+MALFORMED = [
+    b"DATA:Gyro=1,2,3 | Distance(cm)=Front | MotorState=F\n",     # IndexError in the legacy parser
+    b"DATA:Gyro=1,2 | MotorState=STOP\n",                          # ValueError (too few values)
+    b"DATA:\xff\xfe garbage\n",
+]
+
+
+# A pty pair stands in for the Arduino: the reader opens the slave side by path,
+# the test writes serial lines into the master side.
+@pytest.fixture
+def fake_arduino():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    reader = ArduinoReader(os.ttyname(slave))
+    reader.start()
+    # Opening the port flushes its input, so only write once the reader is connected
+    assert reader.connected.wait(5)
+    yield master, reader
+    reader.stop()
+    time.sleep(0.3)
+    os.close(master)
+    os.close(slave)
+
+
+def collect(reader, count, timeout=5):
+    samples = []
+    deadline = time.monotonic() + timeout
+    while len(samples) < count and time.monotonic() < deadline:
+        samples += reader.drain()
+        time.sleep(0.05)
+    return samples
+
+
+def test_good_lines(fake_arduino):
+    master, reader = fake_arduino
+    for _ in range(50):
+        os.write(master, GOOD)
+    samples = collect(reader, 50)
+    assert len(samples) == 50
+    assert samples[0]["Gyro"] == {"X": 0.12, "Y": -0.40, "Z": 9.81}
+    assert samples[0]["Distances"] == {"Front": 120.0, "Left": 35.0, "Right": 48.0}
+    assert samples[0]["MotorState"] == "FORWARD"
+
+
+def test_malformed_lines_do_not_stop_the_reader(fake_arduino):
+    master, reader = fake_arduino
+    for line in MALFORMED:
+        os.write(master, line)
+        os.write(master, GOOD)
+    samples = collect(reader, len(MALFORMED) + 1)
+    assert [s["MotorState"] for s in samples if "Gyro" in s] == ["FORWARD"] * len(MALFORMED)
+    assert reader.bad_lines == 2
+
+    # The reader thread is still alive and keeps reading
+    os.write(master, GOOD)
+    assert len(collect(reader, 1)) == 1
+
+
+def test_line_split_across_reads(fake_arduino):
+    master, reader = fake_arduino
+    for cut in (5, len(GOOD) // 2, len(GOOD) - 1):
+        os.write(master, GOOD[:cut])
+        time.sleep(0.3)
+        os.write(master, GOOD[cut:])
+    samples = collect(reader, 3)
+    assert len(samples) == 3
+    assert all(s["MotorState"] == "FORWARD" and s["Distances"]["Right"] == 48.0 for s in samples)
+    assert reader.bad_lines == 0
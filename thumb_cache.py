@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+# Preview widths we actually generate; any requested width is rounded up to one of these
+# so the cache holds a handful of variants per frame instead of one per pixel value.
+THUMB_WIDTHS = (160, 320, 640, 960)
+THUMB_QUALITY = 80
+
+
+def snap_width(w):
+    for width in THUMB_WIDTHS:
+        if w <= width:
+            return width
+    return THUMB_WIDTHS[-1]
+
+
+# Decodes at reduced size with JPEG draft mode (the decoder scales by 1/2, 1/4 or 1/8
+# while decoding), then resizes and re-encodes. Written to a temp file and renamed in.
+def render_thumbnail(src, dest, width):
+    with Image.open(src) as im:
+        height = max(1, round(im.height * width / im.width))
+        im.draft("RGB", (width, height))
+        im = im.convert("RGB")
+        im.thumbnail((width, height), Image.LANCZOS)
+        tmp = f"{dest}.{threading.get_ident()}.tmp"
+        im.save(tmp, "JPEG", quality=THUMB_QUALITY, optimize=True)
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
+
+
+# Size-bounded LRU disk cache of downscaled previews.
+# Generation runs in a small worker pool; concurrent requests for the same preview share one job.
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes, workers=2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # name -> size, least recently used first
+        self.total_bytes = 0
+        self.jobs = {}                 # name -> Future while being generated
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # Rebuild LRU order from mtimes (hits touch the file, see _touch)
+        with os.scandir(cache_dir) as it:
+            files = [e for e in it if e.is_file() and e.name.endswith(".jpg")]
+        for e in sorted(files, key=lambda e: e.stat().st_mtime):
+            size = e.stat().st_size
+            self.entries[e.name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _generate(self, src, name, width):
+        dest = os.path.join(self.cache_dir, name)
+        try:
+            size = render_thumbnail(src, dest, width)
+            with self.lock:
+                self.entries[name] = size
+                self.total_bytes += size
+                self._evict()
+            return dest
+        finally:
+            with self.lock:
+                self.jobs.pop(name, None)
+
+    # Returns a concurrent.futures.Future resolving to the cached preview path.
+    def get(self, src, width):
+        width = snap_width(width)
+        name = f"w{width}_{os.path.basename(src)}"
+        dest = os.path.join(self.cache_dir, name)
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+                job = self.jobs.get(name)
+                if job is None:
+                    if not os.path.exists(src):
+                        raise FileNotFoundError(src)
+                    job = self.pool.submit(self._generate, src, name, width)
+                    self.jobs[name] = job
+        if hit:
+            self._touch(dest)
+            job = Future()
+            job.set_result(dest)
+        return job
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+
+import paramiko
+
+import metrics
+
+upload_seconds = metrics.Histogram("transfer_upload_seconds", "SFTP upload time per file (Pi5 → Pi4)",
+                                   buckets=metrics.LATENCY_BUCKETS)
+
+
+# One long-lived SSH connection to the Pi4, shared by a small pool of upload workers.
+# Each worker opens its own SFTP channel on the same transport (multiplexed over one TCP
+# connection, one handshake), and paramiko pipelines the writes of every put().
+# Files are uploaded as ".<name>.part" and renamed into place, so UL.py on the Pi4 sees
+# a single IN_MOVED_TO for a complete file.
+class TransferChannel:
+    def __init__(self, host, user, remote_base, port=22, workers=2, queue_size=512, report_every=30,
+                 on_done=None):
+        self.host = host
+        self.on_done = on_done        # on_done(local_path, sent, deleted) after every attempt
+        self.user = user
+        self.port = port
+        self.remote_base = remote_base
+        self.workers = workers
+        self.report_every = report_every
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.lock = threading.Lock()
+        # Held while (re)connecting, which can take the full SSH timeout during an outage;
+        # kept apart from self.lock so submit() / pending() never wait on it
+        self.connect_lock = threading.Lock()
+        self.in_flight = set()       # queued or uploading, used to de-duplicate submits
+        self.client = None
+        self.transport = None
+
+        self.files_sent = 0
+        self.bytes_sent = 0
+        self.failures = 0
+
+    # ==== BAĞLANTI ====
+    def _ensure_transport(self):
+        with self.connect_lock:
+            if self.transport is not None and self.transport.is_active():
+                return self.transport
+            if self.client is not None:
+                self.client.close()
+            client = paramiko.SSHClient()
+            client.load_system_host_keys()
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+            client.connect(self.host, port=self.port, username=self.user, timeout=10)
+            self.transport = client.get_transport()
+            self.transport.set_keepalive(30)
+            self.client = client
+            print(f"[TX] SSH connection to {self.user}@{self.host} established")
+            return self.transport
+
+    # ==== KUYRUK ====
+    # Returns False if the file is already queued/in flight or the queue is full;
+    # the file then stays in Pending and the retry loop offers it again later.
+    def submit(self, local_path, remote_folder):
+        with self.lock:
+            if local_path in self.in_flight:
+                return False
+            self.in_flight.add(local_path)
+        try:
+            self.queue.put_nowait((local_path, remote_folder))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.in_flight.discard(local_path)
+            return False
+
+    def pending(self):
+        with self.lock:
+            return len(self.in_flight)
+
+    # ==== GÖNDERİM ====
+    def _upload(self, sftp, local_path, remote_folder):
+        filename = os.path.basename(local_path)
+        remote_dir = f"{self.remote_base}/{remote_folder}"
+        tmp_path = f"{remote_dir}/.{filename}.part"
+
+        before = os.stat(local_path)
+        sftp.put(local_path, tmp_path, confirm=True)
+        sftp.posix_rename(tmp_path, f"{remote_dir}/{filename}")
+
+        # Pi5_Latest.json is rewritten in place; only delete the version we actually sent
+        after = os.stat(local_path)
+        deleted = (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+        if deleted:
+            os.remove(local_path)
+        with self.lock:
+            self.files_sent += 1
+            self.bytes_sent += before.st_size
+        if deleted:
+            print(f"[✓] Sent and deleted → {remote_folder}/{filename}")
+        else:
+            print(f"[✓] Sent → {remote_folder}/{filename} (changed while sending, kept for the next round)")
+        return deleted
+
+    def _worker(self):
+        sftp = None
+        while True:
+            local_path, remote_folder = self.queue.get()
+            sent = deleted = False
+            try:
+                if sftp is None:
+                    sftp = self._ensure_transport().open_sftp_client()
+                started = time.perf_counter()
+                deleted = self._upload(sftp, local_path, remote_folder)
+                upload_seconds.observe(time.perf_counter() - started)
+                sent = True
+            except Exception as e:
+                # paramiko reports a remote ENOENT (missing folder on the Pi4, failed rename)
+                # as FileNotFoundError too; only a file gone locally is settled here
+                if isinstance(e, FileNotFoundError) and not os.path.exists(local_path):
+                    # Gone locally (evicted / already sent): nothing left to do for it
+                    deleted = True
+                    continue
+                with self.lock:
+                    self.failures += 1
+                print(f"[!] Failed to send: {os.path.basename(local_path)} → {e}")
+                if sftp is not None:
+                    sftp.close()
+                sftp = None
+                time.sleep(1)
+            finally:
+                with self.lock:
+                    self.in_flight.discard(local_path)
+                self.queue.task_done()
+                if self.on_done is not None:
+                    self.on_done(local_path, sent, deleted)
+
+    def _reporter(self):
+        last_bytes, last_files, last_t = 0, 0, time.monotonic()
+        while True:
+            time.sleep(self.report_every)
+            now = time.monotonic()
+            with self.lock:
+                files, sent, failures, queued = self.files_sent, self.bytes_sent, self.failures, len(self.in_flight)
+            rate = (sent - last_bytes) / 1024 / (now - last_t)
+            print(f"[TX] {files - last_files} files, {rate:.1f} KB/s, {queued} queued, {failures} failures total")
+            last_bytes, last_files, last_t = sent, files, now
+
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._reporter, daemon=True).start()
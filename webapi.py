@@ -1,8 +1,23 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import Optional
+import asyncio
+import json
 import os
 
+import config
+import db
+import metrics
+import queries
+from events import EventBroadcaster, start_listener
+from file_index import FileIndex, parse_time
+from segments import SEGMENT_SUFFIXES, compression_of
+from thumb_cache import ThumbnailCache
+
 app = FastAPI()
 
 # 🔓 CORS ayarı (frontend erişimi için)
@@ -12,64 +27,275 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Bucket", "X-Source", "X-Retained-Since", "ETag", "Content-Range"],
 )
+metrics.instrument_app(app)
 
 # 📁 Klasör tanımları
-IMAGE_FOLDER = "/home/mergen/Desktop/db/Images"
-LOG_FOLDER = "/home/mergen/Desktop/db/Logs"
+IMAGE_FOLDER = os.path.join(config.DATA_DIR, "Images")
+LOG_FOLDER = os.path.join(config.DATA_DIR, "Logs")
+THUMB_FOLDER = os.path.join(config.DATA_DIR, "Thumbs")
+
+# 🖼️ Küçük önizleme önbelleği (LRU, disk boyutu sınırlı)
+THUMB_CACHE_MAX_BYTES = 200 * 1024 * 1024
+THUMB_WORKERS = 2
+thumbnails = None
+
+# 📇 Sıralı dosya indeksleri (inotify ile güncel tutulur)
+image_index = FileIndex(IMAGE_FOLDER, ".jpg")
+# JSON logs plus the NDJSON segments (Arduino_*, ChangeAudit_*) shipped by the Pi5
+LOG_SUFFIXES = (".json",) + tuple(SEGMENT_SUFFIXES.values())
+log_index = FileIndex(LOG_FOLDER, LOG_SUFFIXES)
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# 📡 Canlı olay akışı (SSE)
+EVENTS_HEARTBEAT = 15       # seconds between keep-alive comments
+broadcaster = EventBroadcaster(history=2000, client_queue=256)
+metrics.gauge_from("events_subscribers", "Connected /events clients", lambda: len(broadcaster.subscribers))
+metrics.gauge_from("thumbnail_cache_bytes", "Disk used by the thumbnail cache", lambda: thumbnails.total_bytes)
+
+@app.on_event("startup")
+async def start_event_feed():
+    broadcaster.attach(asyncio.get_running_loop())
+    # LISTEN holds its connection forever, so it gets a dedicated one outside the pool
+    start_listener(db.direct_connection, broadcaster)
+
+@app.on_event("startup")
+def start_indexes():
+    global thumbnails
+    image_index.start()
+    log_index.start()
+    thumbnails = ThumbnailCache(THUMB_FOLDER, THUMB_CACHE_MAX_BYTES, workers=THUMB_WORKERS)
+
+# Newest-first page of an index; the cursor for the next page goes into X-Next-Cursor
+def list_page(index, url_prefix, response, limit, cursor, since, until):
+    try:
+        names, next_cursor = index.page(limit, cursor=cursor, since=parse_time(since), until=parse_time(until))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time filter: {e}")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [{"filename": f, "url": f"{url_prefix}/{f}"} for f in names]
+
+# 🗄️ HTTP önbellek başlıkları
+# Frames never change once captured, so browsers may keep them forever.
+# JSON logs can be overwritten in place (Pi5_Latest.json), so they are always revalidated.
+# NDJSON segments are written once; compressed ones are served as stored with a
+# Content-Encoding, so browsers decompress them transparently.
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+CONTENT_ENCODINGS = {"gzip": "gzip", "zstd": "zstd"}
+
+def etag_for(st):
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# FileResponse with strong ETag / Last-Modified and 304 handling.
+# Range / If-Range requests (single and multipart 206, 416) are answered by FileResponse itself.
+def cached_file_response(request, path, media_type, cache_control, extra_headers=None):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    etag = etag_for(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        **(extra_headers or {}),
+    }
+    if not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
 
 @app.get("/")
 def root():
     return {"message": "FastAPI is running on Pi4"}
 
-# 🖼️ /images
-@app.get("/images")
-def list_image_files():
-    try:
-        files = sorted(
-            [{"filename": f, "url": f"/image/{f}"} for f in os.listdir(IMAGE_FOLDER) if f.lower().endswith(".jpg")],
-            key=lambda x: x["filename"],
-            reverse=True
-        )
-        return files
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image folder error: {e}")
-
+# 🖼️ /images  (?limit=&cursor=&since=&until=, since/until ISO tarih)
 # 🖼️ /Images (alias)
+@app.get("/images")
 @app.get("/Images")
-def get_images_alias():
-    return list_image_files()
+def list_image_files(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    return list_page(image_index, "/image", response, limit, cursor, since, until)
 
-# 🖼️ /image/{filename}
+# 🖼️ /image/{filename}  (?w=320 → küçültülmüş önizleme)
 @app.get("/image/{filename}")
-def serve_image(filename: str):
+async def serve_image(filename: str, request: Request, w: Optional[int] = Query(None, ge=1)):
     path = os.path.join(IMAGE_FOLDER, filename)
-    if os.path.exists(path):
-        return FileResponse(path, media_type="image/jpeg")
+    if w is not None:
+        try:
+            # Generated in the thumbnail worker pool; the event loop only awaits the result
+            path = await asyncio.wrap_future(thumbnails.get(path, w))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Image not found")
+        except OSError as e:
+            raise HTTPException(status_code=422, detail=f"Preview could not be generated: {e}")
+    response = await run_in_threadpool(cached_file_response, request, path, "image/jpeg", IMMUTABLE_CACHE)
+    if response is not None:
+        return response
     raise HTTPException(status_code=404, detail="Image not found")
 
-# 📄 /logs
-@app.get("/logs")
-def list_log_files():
-    try:
-        files = sorted(
-            [{"filename": f, "url": f"/log/{f}"} for f in os.listdir(LOG_FOLDER) if f.lower().endswith(".json")],
-            key=lambda x: x["filename"],
-            reverse=True
-        )
-        return files
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Log folder error: {e}")
+# 🖼️ /thumb/{filename}  (galeri için varsayılan 320 px)
+@app.get("/thumb/{filename}")
+async def serve_thumbnail(filename: str, request: Request, w: int = Query(320, ge=1)):
+    return await serve_image(filename, request, w)
 
+# 📄 /logs  (?limit=&cursor=&since=&until=)
 # 📄 /Logs (alias)
+@app.get("/logs")
 @app.get("/Logs")
-def get_logs_alias():
-    return list_log_files()
+def list_log_files(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    return list_page(log_index, "/log", response, limit, cursor, since, until)
 
-# 📄 /log/{filename}
+# 📄 /log/{filename}  (JSON log or NDJSON segment)
 @app.get("/log/{filename}")
-def serve_log(filename: str):
+def serve_log(filename: str, request: Request):
     path = os.path.join(LOG_FOLDER, filename)
-    if os.path.exists(path):
-        return FileResponse(path, media_type="application/json")
+    if filename.lower().endswith(".json"):
+        response = cached_file_response(request, path, "application/json", REVALIDATE_CACHE)
+    else:
+        encoding = CONTENT_ENCODINGS.get(compression_of(filename))
+        response = cached_file_response(request, path, "application/x-ndjson", IMMUTABLE_CACHE,
+                                        {"Content-Encoding": encoding} if encoding else None)
+    if response is not None:
+        return response
     raise HTTPException(status_code=404, detail="Log file not found")
+
+# 📈 /history/{series}  (series: arduino, pi5, ai)
+# Time-range rows straight from the DB instead of one /log/ fetch per JSON file:
+#   ?since=&until=&limit=&cursor=&order=asc|desc&format=ndjson|columnar
+# Rows are streamed as NDJSON; the keyset cursor for the next page is in X-Next-Cursor.
+# arduino/pi5 keep raw rows for queries.RETENTION["raw"] only: when the range reaches
+# further back, X-Retained-Since gives the oldest time still held (use /aggregate before it).
+# The row_id column and (time, row_id) indexes are added by UL.py at startup, not here.
+HISTORY_PAGE_SIZE = 5000
+MAX_HISTORY_PAGE_SIZE = 100000
+
+def history_series(series, fmt):
+    if series not in queries.SERIES:
+        raise HTTPException(status_code=404, detail=f"Unknown series; use {', '.join(queries.SERIES)}")
+    if fmt not in queries.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(queries.FORMATS)}")
+
+@app.get("/history/{series}")
+def history_rows(
+    series: str,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    format: str = "ndjson",
+):
+    history_series(series, format)
+    try:
+        start = parse_time(since)
+        next_cursor, chunks = queries.rows_query(series, limit, cursor, start, parse_time(until),
+                                                 descending=order == "desc", fmt=format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time filter or cursor: {e}")
+    headers = {"X-Source": "raw"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    retained = queries.retained_since(queries.SERIES[series], "raw")
+    if retained is not None and (start is None or start < retained):
+        headers["X-Retained-Since"] = retained.isoformat()
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+# 📊 /history/{series}/aggregate  (?bucket=minute|hour|day&since=&until=&fields=gyrox,frontdistance)
+# Per-bucket count and min/avg/max of each field, computed in PostgreSQL;
+# for "ai" every bucket also carries the anomaly count.
+# Without ?bucket= the bucket is picked from the range; arduino/pi5 are read from the
+# coarsest rollup table that fits and still holds `since`; minute buckets past the
+# minute retention come back hourly (X-Bucket / X-Source say which).
+@app.get("/history/{series}/aggregate")
+def history_aggregate(
+    series: str,
+    since: str,
+    until: Optional[str] = None,
+    bucket: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = "ndjson",
+):
+    history_series(series, format)
+    try:
+        end = parse_time(until) if until else datetime.now()
+        sql, params, bucket, source = queries.aggregate_query(series, bucket, parse_time(since), end,
+                                                              fields.split(",") if fields else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(queries.stream(sql, params, format), media_type="application/x-ndjson",
+                             headers={"X-Bucket": bucket, "X-Source": source})
+
+# 📡 /events  (Server-Sent Events: frame, arduino, pi5_stats, ai_result)
+# Reconnecting clients send Last-Event-ID (or ?cursor=) and get the missed events replayed.
+# Each client has its own bounded queue; a client that falls behind is caught up from
+# the shared history, or told to reload with a "reset" event, without slowing the others.
+def sse_message(event_id, event):
+    return f"id: {event_id}\nevent: {event.get('type', 'message')}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/events")
+async def event_stream(request: Request, cursor: Optional[str] = None):
+    resume = request.headers.get("last-event-id") or cursor
+    sub = broadcaster.subscribe()
+    backlog = broadcaster.replay(resume) if resume else []
+
+    async def stream():
+        last_seq = 0
+        try:
+            yield "retry: 3000\n\n"
+            pending = backlog
+            while True:
+                if pending is None:
+                    yield "event: reset\ndata: {}\n\n"
+                    pending = []
+                for event_id, event in pending:
+                    seq = broadcaster.seq_of(event_id)
+                    if seq > last_seq:
+                        last_seq = seq
+                        yield sse_message(event_id, event)
+                pending = []
+
+                if sub.overflowed and sub.queue.empty():
+                    sub.overflowed = False
+                    pending = broadcaster.replay(f"{broadcaster.boot}-{last_seq}")
+                    continue
+                try:
+                    event_id, event = await asyncio.wait_for(sub.queue.get(), EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                pending = [(event_id, event)]
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})